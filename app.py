@@ -1,66 +1,38 @@
 import streamlit as st
+from streamlit import runtime
 import sqlite3
-import pandas as pd
-from datetime import datetime, timedelta
-import plotly.express as px
-import plotly.graph_objects as go
-import hashlib
-
-# Initialize connection to the database
-conn = sqlite3.connect('finance_tracker.db', check_same_thread=False)
-
-# Create necessary tables before attempting to migrate
-conn.execute('''CREATE TABLE IF NOT EXISTS transactions
-                (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                 date TEXT, category TEXT, amount REAL, description TEXT, type TEXT)''')
-conn.execute('''CREATE TABLE IF NOT EXISTS categories
-                (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                 name TEXT UNIQUE)''')
-conn.execute('''CREATE TABLE IF NOT EXISTS users
-                (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                 username TEXT UNIQUE, password TEXT)''')
-conn.commit()
-
-# Database migration and initialization
-def migrate_database():
-    cursor = conn.cursor()
-    cursor.execute("DROP TABLE IF EXISTS income")
-    cursor.execute("PRAGMA table_info(transactions)")
-    columns = [column[1] for column in cursor.fetchall()]
-    if 'type' not in columns:
-        cursor.execute("ALTER TABLE transactions ADD COLUMN type TEXT")
-    cursor.execute('''CREATE TABLE IF NOT EXISTS goals
-                      (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                       name TEXT,
-                       target_amount REAL,
-                       current_amount REAL,
-                       deadline TEXT)''')
-    cursor.execute('''CREATE TABLE IF NOT EXISTS scheduled_transactions
-                      (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                       date TEXT,
-                       category TEXT,
-                       amount REAL,
-                       description TEXT,
-                       type TEXT,
-                       frequency TEXT)''')
-    conn.commit()
-
-migrate_database()
-
-# Hash password function
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
-
-# CRUD functions for users
-def add_user(username, password):
-    hashed_password = hash_password(password)
-    conn.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, hashed_password))
-    conn.commit()
-
-def validate_user(username, password):
-    hashed_password = hash_password(password)
-    user = conn.execute("SELECT * FROM users WHERE username = ? AND password = ?", (username, hashed_password)).fetchone()
-    return user is not None
+import sys
+import os
+import tempfile
+from datetime import datetime
+from finance_tracker import profiling
+from finance_tracker.db import connections, query_cache, to_cents, to_day
+from finance_tracker.schema import ensure_schema
+from finance_tracker.users import add_user, validate_user
+
+# The data layer lives in the finance_tracker package, whose modules stay
+# loaded between reruns: the schema is migrated once per process, and pandas,
+# numpy and plotly are only imported once someone has logged in.
+# Command line tools run from there too (python -m finance_tracker); this
+# script forwards to them when run outside Streamlit:
+#   python app.py export transactions.csv.gz --compression gzip --start 2024-01-01
+if __name__ == '__main__' and not runtime.exists():
+    from finance_tracker.__main__ import main
+    sys.exit(main(sys.argv[1:], prog='app.py'))
+
+# With FINANCE_TRACKER_PROFILE=1 every rerun is profiled: SQL statements,
+# data functions and charts are timed, shown in a sidebar panel at the end of
+# the script and appended to the profile log. Reruns cut short by
+# st.experimental_rerun() are dropped.
+if profiling.ENABLED:
+    profiling.start()
+
+# Streamlit may run a session's reruns on different threads, so each session
+# keeps its own connection and binds it to the thread running the script
+if 'db_connection' not in st.session_state:
+    st.session_state.db_connection = connections.connect()
+connections.bind(st.session_state.db_connection)
+search_available = ensure_schema()
 
 # Login page
 if 'logged_in' not in st.session_state:
@@ -71,8 +43,10 @@ if not st.session_state.logged_in:
     username = st.text_input("Username")
     password = st.text_input("Password", type="password")
     if st.button("Login"):
-        if validate_user(username, password):
+        user_id = validate_user(username, password)
+        if user_id is not None:
             st.session_state.logged_in = True
+            st.session_state.user_id = user_id
             st.success("Logged in successfully!")
             st.experimental_rerun()
         else:
@@ -87,128 +61,71 @@ if not st.session_state.logged_in:
         else:
             st.error("Please enter a username and password")
 else:
-    # Initialize connection to the database
-    conn = sqlite3.connect('finance_tracker.db', check_same_thread=False)
-
-    # CRUD functions for goals
-    def add_goal(name, target_amount, deadline):
-        conn.execute("INSERT INTO goals (name, target_amount, current_amount, deadline) VALUES (?, ?, ?, ?)",
-                     (name, target_amount, 0, deadline.strftime('%Y-%m-%d')))
-        conn.commit()
-
-    def get_goals():
-        df = pd.read_sql_query("SELECT * FROM goals", conn)
-        df['deadline'] = pd.to_datetime(df['deadline'])
-        return df
-
-    def update_goal(goal_id, name, target_amount, current_amount, deadline):
-        conn.execute("UPDATE goals SET name = ?, target_amount = ?, current_amount = ?, deadline = ? WHERE id = ?",
-                     (name, target_amount, current_amount, deadline.strftime('%Y-%m-%d'), goal_id))
-        conn.commit()
-
-    def delete_goal(goal_id):
-        conn.execute("DELETE FROM goals WHERE id = ?", (goal_id,))
-        conn.commit()
-
-    # Function to update goals based on current balance
-    def update_goals_with_balance(balance):
-        goals = get_goals()
-        if goals.empty:
-            return
-        total_allocated = goals['current_amount'].sum()
-        unallocated_balance = max(0, balance - total_allocated)
-        if unallocated_balance == 0:
-            return
-        total_remaining = goals['target_amount'].sum() - goals['current_amount'].sum()
-        if total_remaining <= 0:
-            return
-        for _, goal in goals.iterrows():
-            remaining = goal['target_amount'] - goal['current_amount']
-            if remaining <= 0:
+    # Everything below is scoped to the logged-in user's partition; functions
+    # take the user id first so cached results are keyed by it too
+    user_id = st.session_state.user_id
+
+    import pandas as pd
+    import plotly.express as px
+    import plotly.graph_objects as go
+    from finance_tracker.ledger import (
+        CATEGORY_ASSIGNMENT, TREND_RESOLUTIONS, add_category, add_goal, add_scheduled_transaction, add_transaction,
+        apply_edits, date_cursor, fts_query, get_categories, get_category_breakdown, get_forecast, get_goals,
+        get_recent_transactions, get_scheduled_transactions, get_statistics, get_transactions_page, get_trend)
+    from finance_tracker.statements import IMPORT_FIELDS, import_transactions, iter_csv_chunks, iter_ofx_chunks, read_csv_header
+    from finance_tracker.export import export_transactions
+    from finance_tracker.worker import JOBS, BackgroundWorker, get_job_status
+
+    # Background jobs run on one worker thread per process, woken by writes
+    @st.cache_resource
+    def get_worker():
+        worker = BackgroundWorker(connections, JOBS)
+        query_cache.add_listener(worker.enqueue_all)
+        worker.start()
+        return worker
+
+    # Shared data_editor with write-back. The editor's delta (edited and deleted
+    # rows) from the previous run is applied with apply_edits(); rows with
+    # 'Delete' ticked are deleted. Positions in the delta are resolved against
+    # the ids that were on screen, so rows inserted in the meantime cannot shift
+    # an edit onto the wrong row. Returns the number of rows changed; when a
+    # delta changed nothing (its rows are gone or the write failed) the table
+    # is shown again with a message instead.
+    def editable_table(user_id, name, table, frame, column_config, columns, converters=None, assignments=None):
+        converters = converters or {}
+        version = st.session_state.get(f'{name}_editor_version', 0)
+        key = f'{name}_editor_{version}'
+        delta = st.session_state.get(key) or {}
+        ids = st.session_state.get(f'{name}_editor_ids', [])
+        updates, deletes = {}, []
+        for position, changes in delta.get('edited_rows', {}).items():
+            row_id = ids[int(position)]
+            if changes.get('Delete'):
+                deletes.append(row_id)
                 continue
-            proportion = remaining / total_remaining
-            allocation = min(remaining, unallocated_balance * proportion)
-            new_current_amount = goal['current_amount'] + allocation
-            update_goal(goal['id'], goal['name'], goal['target_amount'], new_current_amount, goal['deadline'])
-
-    # CRUD functions for transactions
-    def add_transaction(date, category, amount, description, transaction_type):
-        conn.execute("INSERT INTO transactions (date, category, amount, description, type) VALUES (?, ?, ?, ?, ?)",
-                     (date, category, amount, description, transaction_type))
-        conn.commit()
-
-    def get_all_transactions():
-        df = pd.read_sql_query("SELECT * FROM transactions", conn)
-        df['date'] = pd.to_datetime(df['date'])
-        return df
-
-    def delete_transaction(transaction_id):
-        conn.execute("DELETE FROM transactions WHERE id = ?", (transaction_id,))
-        conn.commit()
-
-    def update_transaction(transaction_id, date, category, amount, description, transaction_type):
-        conn.execute("UPDATE transactions SET date = ?, category = ?, amount = ?, description = ?, type = ? WHERE id = ?",
-                     (date.strftime('%Y-%m-%d'), category, amount, description, transaction_type, transaction_id))
-        conn.commit()
-
-    # Function to get statistics
-    def get_statistics():
-        transactions = get_all_transactions()
-        if not transactions.empty:
-            income = transactions[transactions['type'] == 'Income']['amount'].sum()
-            expenses = transactions[transactions['type'] == 'Expense']['amount'].sum()
-            balance = income - expenses
-            update_goals_with_balance(balance)
-            return income, expenses, balance
-        return 0, 0, 0
-
-    # CRUD functions for categories
-    def get_categories():
-        return pd.read_sql_query("SELECT * FROM categories", conn)
-
-    def add_category(name):
-        conn.execute("INSERT INTO categories (name) VALUES (?)", (name,))
-        conn.commit()
-
-    def update_category(category_id, new_name):
-        conn.execute("UPDATE categories SET name = ? WHERE id = ?", (new_name, category_id))
-        conn.commit()
-
-    def delete_category(category_id):
-        conn.execute("DELETE FROM categories WHERE id = ?", (category_id,))
-        conn.commit()
-
-    # Functions for scheduled transactions
-    def add_scheduled_transaction(date, category, amount, description, transaction_type, frequency):
-        conn.execute("INSERT INTO scheduled_transactions (date, category, amount, description, type, frequency) VALUES (?, ?, ?, ?, ?, ?)",
-                     (date, category, amount, description, transaction_type, frequency))
-        conn.commit()
-
-    def get_scheduled_transactions():
-        return pd.read_sql_query("SELECT * FROM scheduled_transactions", conn)
-
-    def delete_scheduled_transaction(transaction_id):
-        conn.execute("DELETE FROM scheduled_transactions WHERE id = ?", (transaction_id,))
-        conn.commit()
-
-    def process_scheduled_transactions():
-        scheduled = get_scheduled_transactions()
-        today = datetime.now().date()
-        for _, transaction in scheduled.iterrows():
-            transaction_date = datetime.strptime(transaction['date'], '%Y-%m-%d').date()
-            if transaction_date <= today:
-                add_transaction(transaction['date'], transaction['category'], transaction['amount'],
-                                transaction['description'], transaction['type'])
-                if transaction['frequency'] == 'One-time':
-                    delete_scheduled_transaction(transaction['id'])
-                elif transaction['frequency'] == 'Weekly':
-                    new_date = (transaction_date + timedelta(days=7)).strftime('%Y-%m-%d')
-                elif transaction['frequency'] == 'Monthly':
-                    new_date = (transaction_date + timedelta(days=30)).strftime('%Y-%m-%d')
-                elif transaction['frequency'] == 'Yearly':
-                    new_date = (transaction_date + timedelta(days=365)).strftime('%Y-%m-%d')
-                conn.execute("UPDATE scheduled_transactions SET date = ? WHERE id = ?", (new_date, transaction['id']))
-        conn.commit()
+            changed_columns = tuple(column for column in columns if column in changes)
+            if changed_columns:
+                values = [converters.get(column, lambda value: value)(changes[column]) for column in changed_columns]
+                updates.setdefault(changed_columns, []).append(values + [row_id])
+        deletes.extend(ids[int(position)] for position in delta.get('deleted_rows', []))
+        if updates or deletes:
+            # A fresh key discards the delta so it is not replayed on the next run
+            st.session_state[f'{name}_editor_version'] = version + 1
+            key = f'{name}_editor_{version + 1}'
+            try:
+                changed = apply_edits(user_id, table, updates, deletes, assignments)
+            except sqlite3.Error as e:
+                st.error(f'No changes were saved: {e}')
+            else:
+                if changed:
+                    return changed
+                st.warning('No rows were changed; they may have been deleted in another session.')
+
+        frame['Delete'] = False
+        with profiling.span(f'render: {name} editor'):
+            st.data_editor(frame, column_config=column_config, hide_index=True, use_container_width=True, key=key)
+        st.session_state[f'{name}_editor_ids'] = [int(row_id) for row_id in frame['id']]
+        return 0
 
     # Streamlit app setup
     st.set_page_config(page_title="Finance Tracker", layout="wide")
@@ -233,28 +150,47 @@ else:
         change_page("Goals")
     if st.sidebar.button("Scheduled Transactions"):
         change_page("Scheduled Transactions")
+    if st.sidebar.button("Forecast"):
+        change_page("Forecast")
+    if st.sidebar.button("Import"):
+        change_page("Import")
+    if st.sidebar.button("Export"):
+        change_page("Export")
     if st.sidebar.button("Logout"):
         st.session_state.logged_in = False
+        del st.session_state.user_id
         st.experimental_rerun()
 
-    # Process scheduled transactions
-    process_scheduled_transactions()
+    cache_stats = query_cache.stats()
+    st.sidebar.caption(f"Query cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses")
+
+    # Scheduled transactions and goal allocation run on the background worker
+    worker = get_worker()
+    st.sidebar.subheader("Background Jobs")
+    for job_name in JOBS:
+        job_status = get_job_status(job_name)
+        label = job_name.replace('_', ' ').capitalize()
+        if job_status is None:
+            st.sidebar.caption(f"{label}: not run yet")
+        else:
+            last_run = datetime.fromtimestamp(job_status['last_run']).strftime('%H:%M:%S')
+            st.sidebar.caption(f"{label}: {job_status['status']} at {last_run} ({job_status['duration']:.2f}s)")
 
     # Dashboard
     if st.session_state.page == "Dashboard":
         st.title('Finance Dashboard')
 
-        # Get statistics
-        income, expenses, balance = get_statistics()
+        # Get statistics (in cents)
+        income, expenses, balance = get_statistics(user_id)
 
         # Display statistics in box-like components
         col1, col2, col3 = st.columns(3)
         with col1:
-            st.metric(label="Total Income", value=f"${income:.2f}")
+            st.metric(label="Total Income", value=f"${income / 100:.2f}")
         with col2:
-            st.metric(label="Total Expenses", value=f"${expenses:.2f}")
+            st.metric(label="Total Expenses", value=f"${expenses / 100:.2f}")
         with col3:
-            st.metric(label="Current Balance", value=f"${balance:.2f}")
+            st.metric(label="Current Balance", value=f"${balance / 100:.2f}")
 
         # Add Transaction button
         if st.button('Add New Transaction'):
@@ -263,7 +199,7 @@ else:
 
         # Display recent transactions
         st.subheader("Recent Transactions")
-        transactions = get_all_transactions().tail(5)
+        transactions = get_recent_transactions(user_id, 5)
         if not transactions.empty:
             st.dataframe(transactions[['date', 'category', 'amount', 'description', 'type']], use_container_width=True)
         else:
@@ -271,7 +207,7 @@ else:
 
         # Display goals progress
         st.subheader("Financial Goals Progress")
-        goals = get_goals()
+        goals = get_goals(user_id)
         if not goals.empty:
             for _, goal in goals.iterrows():
                 progress = min(goal['current_amount'] / goal['target_amount'], 1.0)
@@ -282,22 +218,26 @@ else:
 
         # Data visualization
         st.subheader("Expense Breakdown")
-        expenses = get_all_transactions()[get_all_transactions()['type'] == 'Expense']
-        if not expenses.empty:
-            fig = px.pie(expenses, values='amount', names='category', title='Expense Categories', hole=0.4)
-            fig.update_traces(textposition='inside', textinfo='percent+label')
-            st.plotly_chart(fig)
+        expense_totals = get_category_breakdown(user_id, 'Expense')
+        if not expense_totals.empty:
+            with profiling.span('render: expense chart'):
+                fig = px.pie(expense_totals, values='amount', names='category', title='Expense Categories', hole=0.4)
+                fig.update_traces(textposition='inside', textinfo='percent+label')
+                st.plotly_chart(fig)
 
         st.subheader("Income vs Expenses Over Time")
-        transactions = get_all_transactions()
-        if not transactions.empty:
-            transactions['month'] = transactions['date'].dt.to_period('M')
-            monthly_summary = transactions.groupby(['month', 'type'])['amount'].sum().unstack()
-            fig = go.Figure()
-            fig.add_trace(go.Scatter(x=monthly_summary.index.astype(str), y=monthly_summary['Income'], mode='lines+markers', name='Income'))
-            fig.add_trace(go.Scatter(x=monthly_summary.index.astype(str), y=monthly_summary['Expense'], mode='lines+markers', name='Expense'))
-            fig.update_layout(title='Monthly Income vs Expenses', xaxis_title='Month', yaxis_title='Amount', barmode='group')
-            st.plotly_chart(fig)
+        resolution = st.radio('Resolution', list(TREND_RESOLUTIONS), index=2, horizontal=True)
+        trend, bucket_days = get_trend(user_id, resolution)
+        if not trend.empty:
+            mode = 'lines+markers' if resolution == 'Monthly' else 'lines'
+            with profiling.span('render: trend chart'):
+                fig = go.Figure()
+                fig.add_trace(go.Scatter(x=trend.index, y=trend['Income'], mode=mode, name='Income'))
+                fig.add_trace(go.Scatter(x=trend.index, y=trend['Expense'], mode=mode, name='Expense'))
+                fig.update_layout(title=f'{resolution} Income vs Expenses', xaxis_title='Date', yaxis_title='Amount', barmode='group')
+                st.plotly_chart(fig)
+            if bucket_days not in (None, TREND_RESOLUTIONS[resolution]):
+                st.caption(f'Each point covers {bucket_days} days.')
 
     # Transactions page
     elif st.session_state.page == "Transactions":
@@ -306,27 +246,70 @@ else:
         # Add transaction form
         st.subheader('Add New Transaction')
         date = st.date_input('Date', datetime.now())
-        categories = get_categories()['name'].tolist()
+        categories = get_categories(user_id)['name'].tolist()
         category = st.selectbox('Category', categories)
         amount = st.number_input('Amount', min_value=0.01, format='%0.2f')
         description = st.text_input('Description')
         transaction_type = st.selectbox('Transaction Type', ['Income', 'Expense'])
 
         if st.button('Add Transaction'):
-            add_transaction(date.strftime('%Y-%m-%d'), category, amount, description, transaction_type)
+            add_transaction(user_id, date, category, amount, description, transaction_type)
             st.success('Transaction added successfully!')
             st.rerun()
 
         # Display all transactions with dynamic search
         st.subheader('All Transactions')
         search_query = st.text_input('Search Transactions')
-        transactions = get_all_transactions()
-        if search_query:
-            transactions = transactions[transactions.apply(lambda row: row.astype(str).str.contains(search_query, case=False).any(), axis=1)]
+        with st.expander('Filters'):
+            col1, col2 = st.columns(2)
+            with col1:
+                min_amount = st.number_input('Min Amount', min_value=0.0, format='%0.2f')
+            with col2:
+                max_amount = st.number_input('Max Amount (0 for no limit)', min_value=0.0, format='%0.2f')
+            date_range = st.date_input('Date Range', value=[])
+        start_date = date_range[0] if len(date_range) > 0 else None
+        end_date = date_range[1] if len(date_range) > 1 else start_date
+        filters = (search_query, min_amount or None, max_amount or None, start_date, end_date)
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            page_size = st.selectbox('Page Size', [25, 50, 100, 250, 500], index=1)
+        with col2:
+            sort_options = ['Newest first', 'Oldest first']
+            if fts_query(search_query) and search_available:
+                sort_options.insert(0, 'Best match')
+            sort_order = st.selectbox('Sort Order', sort_options)
+        with col3:
+            jump_date = st.date_input('Jump to Date', datetime.now(), disabled=sort_order == 'Best match')
+
+        # Start cursors of the pages visited so far; reset whenever the view changes
+        view = filters + (page_size, sort_order)
+        if st.session_state.get('transactions_view') != view:
+            st.session_state.transactions_view = view
+            st.session_state.transactions_cursors = [None]
+        cursors = st.session_state.transactions_cursors
+        transactions, next_cursor = get_transactions_page(user_id, page_size, sort_order, cursors[-1], *filters)
+
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            if st.button('Previous Page', disabled=len(cursors) == 1):
+                cursors.pop()
+                st.rerun()
+        with col2:
+            if st.button('Next Page', disabled=next_cursor is None):
+                cursors.append(next_cursor)
+                st.rerun()
+        with col3:
+            if st.button('Jump', disabled=sort_order == 'Best match'):
+                st.session_state.transactions_cursors = [None, date_cursor(jump_date, sort_order)]
+                st.rerun()
+        with col4:
+            st.write(f'Page {len(cursors)}')
+
         if not transactions.empty:
-            transactions['Delete'] = False
-            edited_df = st.data_editor(
-                transactions,
+            # Only the visible page is diffed and written back
+            changed = editable_table(
+                user_id, 'transactions', 'transactions', transactions,
                 column_config={
                     "id": st.column_config.NumberColumn("ID", disabled=True),
                     "date": st.column_config.DateColumn("Date"),
@@ -336,22 +319,12 @@ else:
                     "type": st.column_config.SelectboxColumn("Type", options=['Income', 'Expense']),
                     "Delete": st.column_config.CheckboxColumn("Delete")
                 },
-                hide_index=True,
-                use_container_width=True
+                columns=['date', 'category', 'amount', 'description', 'type'],
+                converters={'date': to_day, 'amount': to_cents},
+                assignments={'category': CATEGORY_ASSIGNMENT}
             )
-
-            if not edited_df.equals(transactions):
-                for index, row in edited_df.iterrows():
-                    if row['Delete']:
-                        delete_transaction(row['id'])
-                    elif (row['date'] != transactions.loc[index, 'date'] or
-                          row['category'] != transactions.loc[index, 'category'] or
-                          row['amount'] != transactions.loc[index, 'amount'] or
-                          row['description'] != transactions.loc[index, 'description'] or
-                          row['type'] != transactions.loc[index, 'type']):
-                        update_transaction(row['id'], row['date'], row['category'], row['amount'], row['description'],
-                                           row['type'])
-                st.success('Transactions updated successfully!')
+            if changed:
+                st.success(f'{changed} transactions updated successfully!')
                 st.rerun()
         else:
             st.write('No transactions found.')
@@ -364,34 +337,26 @@ else:
         st.subheader('Add New Category')
         new_category = st.text_input('Category Name')
         if st.button('Add Category'):
-            add_category(new_category)
+            add_category(user_id, new_category)
             st.success('Category added successfully!')
             st.rerun()
 
         # Display and edit categories
         st.subheader('All Categories')
-        categories = get_categories()
+        categories = get_categories(user_id)
         if not categories.empty:
-            categories['Delete'] = False  # Add Delete column
-            edited_df = st.data_editor(
-                categories,
+            # Handle updates and deletions
+            changed = editable_table(
+                user_id, 'categories', 'categories', categories,
                 column_config={
                     "id": st.column_config.NumberColumn("ID", disabled=True),
                     "name": st.column_config.TextColumn("Category Name"),
                     "Delete": st.column_config.CheckboxColumn("Delete"),
                 },
-                hide_index=True,
-                use_container_width=True
+                columns=['name']
             )
-
-            # Handle updates and deletions
-            if not edited_df.equals(categories):
-                for index, row in edited_df.iterrows():
-                    if row['Delete']:
-                        delete_category(row['id'])
-                    elif row['name'] != categories.loc[index, 'name']:
-                        update_category(row['id'], row['name'])
-                st.success('Categories updated successfully!')
+            if changed:
+                st.success(f'{changed} categories updated successfully!')
                 st.rerun()
         else:
             st.write('No categories found.')
@@ -406,17 +371,17 @@ else:
         deadline = st.date_input('Deadline')
 
         if st.button('Add Goal'):
-            add_goal(goal_name, target_amount, deadline)
+            add_goal(user_id, goal_name, target_amount, deadline)
             st.success('Goal added successfully!')
             st.rerun()
 
         # Display and edit goals
         st.subheader('All Goals')
-        goals = get_goals()
+        goals = get_goals(user_id)
         if not goals.empty:
-            goals['Delete'] = False  # Add Delete column
-            edited_df = st.data_editor(
-                goals,
+            # Check for updates and deletions
+            changed = editable_table(
+                user_id, 'goals', 'goals', goals,
                 column_config={
                     "id": st.column_config.NumberColumn("ID", disabled=True),
                     "name": st.column_config.TextColumn("Goal Name"),
@@ -425,30 +390,19 @@ else:
                     "deadline": st.column_config.DateColumn("Deadline"),
                     "Delete": st.column_config.CheckboxColumn("Delete"),
                 },
-                hide_index=True,
-                use_container_width=True
+                columns=['name', 'target_amount', 'current_amount', 'deadline'],
+                converters={'target_amount': to_cents, 'current_amount': to_cents, 'deadline': to_day}
             )
-
-            # Check for updates and deletions
-            if not edited_df.equals(goals):
-                for index, row in edited_df.iterrows():
-                    if row['Delete']:
-                        delete_goal(row['id'])
-                    elif (row['name'] != goals.loc[index, 'name'] or
-                          row['target_amount'] != goals.loc[index, 'target_amount'] or
-                          row['current_amount'] != goals.loc[index, 'current_amount'] or
-                          row['deadline'] != goals.loc[index, 'deadline']):
-                        update_goal(row['id'], row['name'], row['target_amount'], row['current_amount'], row['deadline'])
-                st.success('Goals updated successfully!')
+            if changed:
+                st.success(f'{changed} goals updated successfully!')
                 st.rerun()
         else:
             st.write('No goals found.')
 
         # Manually update goals with current balance
         if st.button('Update Goals with Current Balance'):
-            _, _, balance = get_statistics()  # This will update the goals
-            st.success(f'Goals updated with current balance: ${balance:.2f}')
-            st.rerun()
+            worker.enqueue('update_goals_with_balance')
+            st.success('Goal update queued. Refresh to see the new amounts.')
 
     # Scheduled Transactions page
     elif st.session_state.page == "Scheduled Transactions":
@@ -457,7 +411,7 @@ else:
         # Add scheduled transaction form
         st.subheader('Add New Scheduled Transaction')
         date = st.date_input('Start Date', datetime.now())
-        categories = get_categories()['name'].tolist()
+        categories = get_categories(user_id)['name'].tolist()
         category = st.selectbox('Category', categories)
         amount = st.number_input('Amount', min_value=0.01, format='%0.2f')
         description = st.text_input('Description')
@@ -465,18 +419,17 @@ else:
         frequency = st.selectbox('Frequency', ['One-time', 'Weekly', 'Monthly', 'Yearly'])
 
         if st.button('Add Scheduled Transaction'):
-            add_scheduled_transaction(date.strftime('%Y-%m-%d'), category, amount, description, transaction_type, frequency)
+            add_scheduled_transaction(user_id, date, category, amount, description, transaction_type, frequency)
             st.success('Scheduled transaction added successfully!')
             st.rerun()
 
         # Display scheduled transactions
         st.subheader('All Scheduled Transactions')
-        scheduled_transactions = get_scheduled_transactions()
+        scheduled_transactions = get_scheduled_transactions(user_id)
         if not scheduled_transactions.empty:
-            scheduled_transactions['date'] = pd.to_datetime(scheduled_transactions['date'])  # Convert to datetime
-            scheduled_transactions['Delete'] = False
-            edited_df = st.data_editor(
-                scheduled_transactions,
+            # Handle updates and deletions
+            changed = editable_table(
+                user_id, 'scheduled_transactions', 'scheduled_transactions', scheduled_transactions,
                 column_config={
                     "id": st.column_config.NumberColumn("ID", disabled=True),
                     "date": st.column_config.DateColumn("Next Date"),
@@ -487,26 +440,142 @@ else:
                     "frequency": st.column_config.SelectboxColumn("Frequency", options=['One-time', 'Weekly', 'Monthly', 'Yearly']),
                     "Delete": st.column_config.CheckboxColumn("Delete")
                 },
-                hide_index=True,
-                use_container_width=True
+                columns=['date', 'category', 'amount', 'description', 'type', 'frequency'],
+                converters={'date': to_day, 'amount': to_cents}
             )
-
-            # Handle updates and deletions
-            if not edited_df.equals(scheduled_transactions):
-                for index, row in edited_df.iterrows():
-                    if row['Delete']:
-                        delete_scheduled_transaction(row['id'])
-                    else:
-                        # Update the scheduled transaction (you'll need to implement this function)
-                        # update_scheduled_transaction(row['id'], row['date'], row['category'], row['amount'], row['description'], row['type'], row['frequency'])
-                        pass
-                st.success('Scheduled transactions updated successfully!')
+            if changed:
+                st.success(f'{changed} scheduled transactions updated successfully!')
                 st.rerun()
         else:
             st.write('No scheduled transactions found.')
 
         # Process scheduled transactions button
         if st.button('Process Scheduled Transactions'):
-            process_scheduled_transactions()
-            st.success('Scheduled transactions processed successfully!')
-            st.rerun()
\ No newline at end of file
+            worker.enqueue('process_scheduled_transactions')
+            st.success('Scheduled transactions queued for processing. Refresh to see new postings.')
+
+    # Forecast page
+    elif st.session_state.page == "Forecast":
+        st.title('Cash-Flow Forecast')
+
+        months = st.slider('Horizon (months)', min_value=1, max_value=120, value=12)
+        forecast, (lowest_date, lowest_balance), goal_dates, below_zero = get_forecast(
+            user_id, months, to_day(datetime.now().date()))
+
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric(label="Projected Balance", value=f"${forecast['balance'].iloc[-1]:.2f}")
+        with col2:
+            st.metric(label=f"Lowest Balance ({pd.Timestamp(lowest_date):%Y-%m-%d})", value=f"${lowest_balance:.2f}")
+
+        if len(below_zero):
+            dates = ', '.join(f'{pd.Timestamp(day):%Y-%m-%d}' for day in below_zero[:5])
+            st.warning(f'The balance drops below zero {len(below_zero)} time(s), starting on {dates}.')
+
+        with profiling.span('render: forecast chart'):
+            fig = go.Figure(go.Scatter(x=forecast['date'], y=forecast['balance'], mode='lines', name='Balance'))
+            fig.update_layout(title='Projected Balance', xaxis_title='Date', yaxis_title='Amount')
+            st.plotly_chart(fig)
+
+        st.subheader('Goal Completion')
+        if not goal_dates.empty:
+            st.dataframe(goal_dates[['name', 'target_amount', 'deadline', 'reached', 'on_track']],
+                         column_config={
+                             "name": st.column_config.TextColumn("Goal Name"),
+                             "target_amount": st.column_config.NumberColumn("Target Amount", format="$%.2f"),
+                             "deadline": st.column_config.DateColumn("Deadline"),
+                             "reached": st.column_config.DateColumn("Projected Date"),
+                             "on_track": st.column_config.CheckboxColumn("On Track"),
+                         },
+                         use_container_width=True, hide_index=True)
+        else:
+            st.write('No goals set. Add goals in the Goals section.')
+
+    # Import page
+    elif st.session_state.page == "Import":
+        st.title('Import Transactions')
+
+        uploaded = st.file_uploader('Bank Statement (CSV or OFX)', type=['csv', 'ofx', 'qfx'])
+        if uploaded is not None:
+            default_category = st.text_input('Default Category', 'Uncategorized')
+            is_csv = uploaded.name.lower().endswith('.csv')
+            if is_csv:
+                # Map file columns to transaction fields
+                header = read_csv_header(uploaded)
+                options = [''] + header
+                mapping = {}
+                for column, field in zip(st.columns(len(IMPORT_FIELDS)), IMPORT_FIELDS):
+                    guess = next((i for i, name in enumerate(options) if name and field in name.lower()), 0)
+                    with column:
+                        mapping[field] = st.selectbox(f'{field.capitalize()} Column', options, index=guess)
+                date_format = st.text_input('Date Format', '%Y-%m-%d')
+                st.caption('Leave Type empty to take it from the sign of the amount, '
+                           'and Category empty to use the default category.')
+
+            if st.button('Import'):
+                if is_csv and not (mapping['date'] and mapping['amount']):
+                    st.error('Please choose the date and amount columns')
+                else:
+                    if is_csv:
+                        chunks = iter_csv_chunks(uploaded, mapping, date_format, default_category)
+                    else:
+                        chunks = iter_ofx_chunks(uploaded, default_category)
+                    progress_bar = st.progress(0.0)
+                    try:
+                        inserted, skipped = import_transactions(
+                            chunks, user_id, lambda rows: progress_bar.progress(min(uploaded.tell() / max(uploaded.size, 1), 1.0)))
+                        st.success(f'Imported {inserted} transactions ({skipped} duplicates skipped).')
+                    except (ValueError, KeyError, IndexError) as e:
+                        st.error(f'Import stopped at an unreadable row: {e}')
+                    except sqlite3.Error as e:
+                        st.error(f'Import stopped: {e}. Chunks imported before this one were kept; '
+                                 'importing the file again skips them.')
+
+    # Export page
+    elif st.session_state.page == "Export":
+        st.title('Export Transactions')
+
+        date_range = st.date_input('Date Range', value=[])
+        export_categories = st.multiselect('Categories', get_categories(user_id)['name'].tolist())
+        export_type = st.selectbox('Type', ['All', 'Income', 'Expense'])
+        file_format = st.radio('Format', ['csv', 'parquet'], horizontal=True)
+        compression = st.selectbox('Compression', ['gzip', 'none'] if file_format == 'csv' else ['snappy', 'zstd', 'gzip', 'none'])
+
+        if st.button('Prepare Export'):
+            # Written chunk by chunk into a temporary directory of the session's
+            # own, then offered for download. A new export replaces the last
+            # one, and the directory is removed along with the session.
+            if 'export_dir' not in st.session_state:
+                st.session_state.export_dir = tempfile.TemporaryDirectory(prefix='finance_tracker_export_')
+            if 'export_file' in st.session_state:
+                if os.path.exists(st.session_state.export_file[0]):
+                    os.remove(st.session_state.export_file[0])
+                del st.session_state.export_file
+            suffix = '.csv.gz' if file_format == 'csv' and compression == 'gzip' else f'.{file_format}'
+            export_path = os.path.join(st.session_state.export_dir.name, f'transactions{suffix}')
+            try:
+                written = export_transactions(
+                    export_path, file_format, compression, user_id=user_id,
+                    start_date=date_range[0] if len(date_range) > 0 else None,
+                    end_date=date_range[-1] if len(date_range) > 0 else None,
+                    categories=export_categories, transaction_type=None if export_type == 'All' else export_type)
+                st.session_state.export_file = (export_path, f'transactions{suffix}', written)
+            except (RuntimeError, ValueError) as e:
+                st.error(str(e))
+
+        if 'export_file' in st.session_state:
+            path, file_name, written = st.session_state.export_file
+            if os.path.exists(path):
+                with open(path, 'rb') as export_data:
+                    st.download_button(f'Download {written} Transactions', export_data, file_name=file_name)
+
+# Profiling panel for this rerun
+if profiling.ENABLED:
+    report = profiling.finish(st.session_state.page if st.session_state.logged_in else 'Login')
+    functions, statements = profiling.summarize(report)
+    with st.sidebar.expander(f"Profile: {report['total_ms']:.0f} ms"):
+        st.caption(f"{report['sql_ms']:.0f} ms in {len(report['queries'])} SQL statements; "
+                   f"log: {profiling.LOG_PATH}")
+        timing = {column: st.column_config.NumberColumn(format="%.1f") for column in ('ms', 'sql_ms')}
+        st.dataframe(functions, column_config=timing, hide_index=True, use_container_width=True)
+        st.dataframe(statements, column_config=timing, hide_index=True, use_container_width=True)
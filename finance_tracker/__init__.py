@@ -0,0 +1,14 @@
+# Data access and analytics for the Finance Tracker app, with no Streamlit
+# dependency. Importing the package loads nothing; each module imports what it
+# needs, so the sqlite-only modules (db, schema, users, reports) start without
+# pandas or numpy:
+#   db          connections, transactions, the query cache, date/cents conversions
+#   schema      tables, rollups, search index and migrations (ensure_schema)
+#   users       registration and login
+#   ledger      per-user CRUD, search, aggregations and chart data (pandas)
+#   schedules   recurring schedules, the catch-up engine and the forecast (numpy)
+#   goals       goal allocation
+#   worker      background jobs
+#   statements  bank statement import
+#   export      CSV/Parquet export
+#   reports     balances and monthly summaries for the command line
@@ -0,0 +1,164 @@
+import argparse
+import json
+import os
+import sys
+
+from .db import connections
+from .schema import ensure_schema
+from .users import get_user_id
+
+# Command line tools, run without starting Streamlit:
+#   python -m finance_tracker balance
+#   python -m finance_tracker summary --user alice --months 6
+#   python -m finance_tracker export transactions.csv.gz --compression gzip --start 2024-01-01
+#   python -m finance_tracker generate ledger.db --rows 1M
+#   python -m finance_tracker benchmark --sizes 10k,100k --output bench.json --baseline previous.json
+#   python -m finance_tracker verify --rebuild
+# Only export, generate and benchmark load the modules that need pandas.
+def format_cents(cents):
+    return f'{cents / 100:,.2f}'
+
+def print_table(header, rows):
+    rows = [header] + [[str(value) for value in row] for row in rows]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    for row in rows:
+        print('  '.join(value.ljust(width) if i == 0 else value.rjust(width)
+                        for i, (value, width) in enumerate(zip(row, widths))))
+
+def resolve_user(parser, username):
+    if username is None:
+        return None
+    user_id = get_user_id(username)
+    if user_id is None:
+        parser.error(f'unknown user {username!r}')
+    return user_id
+
+def balance(parser, args):
+    from .reports import user_balances
+    rows = [(username, format_cents(income), format_cents(expenses), format_cents(total))
+            for username, income, expenses, total in user_balances()
+            if args.user is None or username == args.user]
+    print_table(['User', 'Income', 'Expenses', 'Balance'], rows)
+
+def summary(parser, args):
+    from .reports import monthly_category_totals, monthly_totals
+    user_id = resolve_user(parser, args.user)
+    if args.by_category:
+        rows = [(month, category, transaction_type, format_cents(amount))
+                for month, category, transaction_type, amount in monthly_category_totals(user_id, args.months)]
+        print_table(['Month', 'Category', 'Type', 'Amount'], rows)
+    else:
+        rows = [(month, format_cents(income), format_cents(expenses), format_cents(net))
+                for month, income, expenses, net in monthly_totals(user_id, args.months)]
+        print_table(['Month', 'Income', 'Expenses', 'Net'], rows)
+
+def export(parser, args):
+    from .export import export_transactions
+    user_id = resolve_user(parser, args.user)
+    file_format = args.format or ('parquet' if args.output.endswith('.parquet') else 'csv')
+    try:
+        written = export_transactions(args.output, file_format, args.compression, user_id=user_id,
+                                      start_date=args.start, end_date=args.end, categories=args.category,
+                                      transaction_type=args.type)
+    except (ValueError, RuntimeError) as e:
+        parser.error(str(e))
+    print(f'Exported {written} transactions to {args.output}')
+
+def generate(parser, args):
+    from .synthetic import generate_ledger, parse_size
+    rows = parse_size(args.rows)
+    try:
+        generate_ledger(args.output, rows, users=args.users, schedules=args.schedules, goals=args.goals,
+                        years=args.years, seed=args.seed,
+                        progress=lambda written: print(f'{written}/{rows} transactions', end='\r', flush=True))
+    except FileExistsError as e:
+        parser.error(str(e))
+    print(f'Generated {rows} transactions for {args.users} user(s) in {args.output}')
+
+def benchmark(parser, args):
+    from .benchmark import CASES, compare, run_benchmarks, write_results
+    cases = args.case or list(CASES)
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        parser.error(f"unknown case(s): {', '.join(sorted(unknown))}; choose from {', '.join(CASES)}")
+    os.makedirs(args.workdir, exist_ok=True)
+    results = run_benchmarks(args.sizes.split(','), args.repeat, cases, args.workdir, args.users, args.seed,
+                             progress=lambda message: print(message, file=sys.stderr))
+    if args.output:
+        with open(args.output, 'w') as out:
+            write_results(results, out)
+    else:
+        write_results(results, sys.stdout)
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline), args.threshold)
+        for size, name, before, after, ratio in regressions:
+            print(f'REGRESSION {size} {name}: p50 {before:.2f} ms -> {after:.2f} ms ({ratio:.2f}x)', file=sys.stderr)
+        if regressions:
+            return 1
+
+# Exits with status 1 when the rollups disagree with the ledger
+def verify(parser, args):
+    from .schema import rebuild_monthly_summary, verify_monthly_summary
+    mismatches = rebuild_monthly_summary() if args.rebuild else verify_monthly_summary()
+    print(f"{'Rebuilt the rollups; ' if args.rebuild else ''}{mismatches} bucket(s) disagree with the ledger")
+    if mismatches:
+        return 1
+
+def main(argv, prog='python -m finance_tracker'):
+    parser = argparse.ArgumentParser(prog=prog, description='Finance Tracker command line tools')
+    parser.add_argument('--database', help=f'database file (default: {connections.path})')
+    commands = parser.add_subparsers(dest='command', required=True)
+    balance_command = commands.add_parser('balance', help='print income, expenses and balance per user')
+    balance_command.add_argument('--user', help='only this user')
+    balance_command.set_defaults(handler=balance)
+    summary_command = commands.add_parser('summary', help="print a user's monthly income and expenses")
+    summary_command.add_argument('--user', required=True)
+    summary_command.add_argument('--months', type=int, default=12, help='number of recent months (default: 12)')
+    summary_command.add_argument('--by-category', action='store_true', help='break each month down by category')
+    summary_command.set_defaults(handler=summary)
+    export_command = commands.add_parser('export', help='export transactions to CSV or Parquet')
+    export_command.add_argument('output')
+    export_command.add_argument('--format', choices=['csv', 'parquet'], help='defaults to the output file extension')
+    export_command.add_argument('--compression',
+                                help="'gzip' for CSV; 'snappy', 'gzip', 'zstd', 'brotli' or 'lz4' for Parquet (default: none)")
+    export_command.add_argument('--start', help='first date to include (YYYY-MM-DD)')
+    export_command.add_argument('--end', help='last date to include (YYYY-MM-DD)')
+    export_command.add_argument('--category', action='append', help='repeat to include several categories')
+    export_command.add_argument('--type', choices=['Income', 'Expense'])
+    export_command.add_argument('--user', help="export only this user's transactions")
+    export_command.set_defaults(handler=export)
+    generate_command = commands.add_parser('generate', help='write a synthetic ledger to a new database file')
+    generate_command.add_argument('output')
+    generate_command.add_argument('--rows', default='100k', help="number of transactions, e.g. 10k, 1M (default: 100k)")
+    generate_command.add_argument('--users', type=int, default=1)
+    generate_command.add_argument('--schedules', type=int, default=200, help='scheduled transactions per user')
+    generate_command.add_argument('--goals', type=int, default=20, help='goals per user')
+    generate_command.add_argument('--years', type=int, default=5, help='years of history')
+    generate_command.add_argument('--seed', type=int, default=0)
+    generate_command.set_defaults(handler=generate, migrate=False)
+    benchmark_command = commands.add_parser('benchmark', help="time each page's data path on synthetic ledgers")
+    benchmark_command.add_argument('--sizes', default='10k,100k', help='comma-separated ledger sizes (default: 10k,100k)')
+    benchmark_command.add_argument('--repeat', type=int, default=10, help='timed runs per case (default: 10)')
+    benchmark_command.add_argument('--case', action='append', help='repeat to run only some cases')
+    benchmark_command.add_argument('--workdir', default='benchmarks',
+                                   help='where generated ledgers are kept and reused (default: benchmarks)')
+    benchmark_command.add_argument('--users', type=int, default=1)
+    benchmark_command.add_argument('--seed', type=int, default=0)
+    benchmark_command.add_argument('--output', help='write the JSON results here instead of stdout')
+    benchmark_command.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    benchmark_command.add_argument('--threshold', type=float, default=1.25,
+                                   help='median slowdown reported as a regression (default: 1.25)')
+    benchmark_command.set_defaults(handler=benchmark, migrate=False)
+    verify_command = commands.add_parser('verify', help='check the monthly and daily rollups against the ledger')
+    verify_command.add_argument('--rebuild', action='store_true', help='rebuild the rollups from the ledger first')
+    verify_command.set_defaults(handler=verify)
+    args = parser.parse_args(argv)
+    if args.database:
+        connections.path = args.database
+    if getattr(args, 'migrate', True):
+        ensure_schema()
+    return args.handler(parser, args) or 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
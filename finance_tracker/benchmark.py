@@ -0,0 +1,170 @@
+import json
+import os
+import platform
+import sqlite3
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from . import ledger
+from .db import query_cache, to_day, transaction, use_database
+from .goals import update_goals_with_balance
+from .schedules import process_scheduled_transactions
+from .schema import migrate_database
+from .synthetic import generate_ledger, parse_size
+
+# Benchmarks of the data path behind each page, run against synthetic ledgers
+# with no browser involved. The query cache is dropped before every run, so
+# each timing is the cold path a page pays after a write. Each case also gets
+# one extra run under tracemalloc for its peak Python heap (SQLite's own
+# memory is not included). Results are JSON; compare() lists the cases whose
+# median got slower than a baseline run.
+def dashboard(context):
+    user_id = context['user_id']
+    ledger.get_statistics(user_id)
+    ledger.get_recent_transactions(user_id, 5)
+    ledger.get_goals(user_id)
+    ledger.get_category_breakdown(user_id, 'Expense')
+    ledger.get_trend(user_id, 'Monthly')
+
+def edit_rows(context, count):
+    # Writes every row's current amount back, so the ledger stays the same
+    # while the triggers still do their full work
+    rows = context['edit_rows'][:count]
+    return ledger.apply_edits(context['user_id'], 'transactions', {('amount',): rows}, [])
+
+def reset_schedules(context):
+    db = context['db']
+    with transaction(db):
+        db.execute("DELETE FROM transactions WHERE schedule_id IS NOT NULL")
+        db.execute("DELETE FROM scheduled_transactions")
+        db.executemany(f"INSERT INTO scheduled_transactions ({', '.join(context['schedule_columns'])}) "
+                       f"VALUES ({', '.join('?' * len(context['schedule_columns']))})", context['schedules'])
+        db.execute("DELETE FROM app_meta WHERE key = 'scheduled_next_due'")
+
+def reset_goals(context):
+    db = context['db']
+    with transaction(db):
+        db.execute("UPDATE goals SET current_amount = 0")
+        db.execute("DELETE FROM app_meta WHERE key = 'goal_allocation_fingerprint'")
+
+# name -> (page, run, untimed setup before each run)
+CASES = {
+    'get_statistics': ('Dashboard', lambda context: ledger.get_statistics(context['user_id']), None),
+    'dashboard': ('Dashboard', dashboard, None),
+    'trend_daily': ('Dashboard', lambda context: ledger.get_trend(context['user_id'], 'Daily'), None),
+    'trend_weekly': ('Dashboard', lambda context: ledger.get_trend(context['user_id'], 'Weekly'), None),
+    'transactions_page': ('Transactions', lambda context: ledger.get_transactions_page(
+        context['user_id'], 50, 'Newest first'), None),
+    'jump_to_date': ('Transactions', lambda context: ledger.get_transactions_page(
+        context['user_id'], 50, 'Newest first', ledger.date_cursor(context['middle_date'], 'Newest first')), None),
+    'search_text': ('Transactions', lambda context: ledger.get_transactions_page(
+        context['user_id'], 50, 'Best match', None, 'coffee'), None),
+    'search_filters': ('Transactions', lambda context: ledger.get_transactions_page(
+        context['user_id'], 50, 'Newest first', None, 'market', 10, 100, context['start_date'],
+        context['middle_date']), None),
+    'ledger_load': ('Transactions', lambda context: ledger.get_all_transactions(context['user_id']), None),
+    'write_back_page': ('Transactions', lambda context: edit_rows(context, 50), None),
+    'write_back_bulk': ('Transactions', lambda context: edit_rows(context, 5000), None),
+    'process_scheduled_transactions': ('Scheduled Transactions',
+                                       lambda context: process_scheduled_transactions(context['db']), reset_schedules),
+    'update_goals_with_balance': ('Goals', lambda context: update_goals_with_balance(context['db']), reset_goals),
+    'forecast': ('Forecast', lambda context: ledger.get_forecast(context['user_id'], 120, context['today']), None),
+}
+
+def percentiles(timings):
+    values = np.array(timings) * 1000
+    return {'runs': len(values), 'min_ms': values.min(), 'p50_ms': np.percentile(values, 50),
+            'p90_ms': np.percentile(values, 90), 'p99_ms': np.percentile(values, 99), 'max_ms': values.max(),
+            'mean_ms': values.mean()}
+
+def benchmark_context(db, user_id=1):
+    first, last = db.execute("SELECT MIN(date), MAX(date) FROM transactions WHERE user_id = ?", (user_id,)).fetchone()
+    schedules = db.execute("SELECT * FROM scheduled_transactions")
+    return {
+        'db': db,
+        'user_id': user_id,
+        'today': to_day(datetime.now().date()),
+        'start_date': pd.Timestamp(first, unit='D').date(),
+        'middle_date': pd.Timestamp((first + last) // 2, unit='D').date(),
+        'edit_rows': db.execute("SELECT amount, id FROM transactions WHERE user_id = ? ORDER BY date DESC, id "
+                                "LIMIT 5000", (user_id,)).fetchall(),
+        'schedules': schedules.fetchall(),
+        'schedule_columns': [column[0] for column in schedules.description],
+    }
+
+def run_case(name, context, repeat):
+    page, run, setup = CASES[name]
+    timings = []
+    for _ in range(repeat + 1):
+        if setup:
+            setup(context)
+        query_cache.invalidate(notify=False)
+        started = time.perf_counter()
+        run(context)
+        timings.append(time.perf_counter() - started)
+    if setup:
+        setup(context)
+    query_cache.invalidate(notify=False)
+    tracemalloc.start()
+    try:
+        run(context)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    # The first run warms SQLite's page cache and is left out
+    return dict(page=page, peak_kb=peak / 1024, **percentiles(timings[1:]))
+
+def run_benchmarks(sizes, repeat=10, cases=None, workdir='.', users=1, seed=0, progress=None):
+    results = {}
+    for size in sizes:
+        rows = parse_size(size)
+        path = os.path.join(workdir, f'ledger-{size}-u{users}-s{seed}.db')
+        if os.path.exists(path):
+            db = use_database(path)
+            # A ledger kept from an earlier run may predate the current schema
+            migrate_database()
+        else:
+            if progress:
+                progress(f'generating {rows} rows into {path}')
+            started = time.perf_counter()
+            db = generate_ledger(path, rows, users=users, seed=seed)
+            if progress:
+                progress(f'generated in {time.perf_counter() - started:.1f}s')
+        context = benchmark_context(db)
+        results[size] = {}
+        for name in cases or CASES:
+            results[size][name] = run_case(name, context, repeat)
+            if progress:
+                progress(f"{size} {name}: p50 {results[size][name]['p50_ms']:.2f} ms, "
+                         f"peak {results[size][name]['peak_kb']:.0f} KB")
+        reset_schedules(context)
+        reset_goals(context)
+    return {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'repeat': repeat, 'users': users, 'seed': seed,
+            'python': sys.version.split()[0], 'sqlite': sqlite3.sqlite_version,
+            'numpy': np.__version__, 'pandas': pd.__version__, 'platform': platform.platform(),
+        },
+        'results': results,
+    }
+
+# (size, case, baseline p50, current p50, ratio) for every case whose median
+# grew by more than `threshold` times
+def compare(current, baseline, threshold=1.25):
+    regressions = []
+    for size, cases in current['results'].items():
+        for name, stats in cases.items():
+            before = baseline['results'].get(size, {}).get(name)
+            if before and stats['p50_ms'] > before['p50_ms'] * threshold:
+                regressions.append((size, name, before['p50_ms'], stats['p50_ms'], stats['p50_ms'] / before['p50_ms']))
+    return regressions
+
+def write_results(results, out):
+    json.dump(results, out, indent=2, default=float)
+    out.write('\n')
@@ -0,0 +1,166 @@
+import os
+import sqlite3
+import threading
+import functools
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+
+from .profiling import ENABLED as PROFILING, ProfiledConnection
+
+DATABASE_PATH = os.environ.get('FINANCE_TRACKER_DB', 'finance_tracker.db')
+
+# Connection manager: connections run in autocommit mode with WAL journaling
+# and tuned pragmas; writes are grouped with transaction(). get() hands each
+# thread one reused connection; bind() makes a thread use a connection it was
+# given instead (the app keeps one per Streamlit session). With profiling on,
+# connections record every statement they run.
+class ConnectionManager:
+    PRAGMAS = (
+        "journal_mode = WAL",
+        "synchronous = NORMAL",
+        "busy_timeout = 5000",
+        "cache_size = -65536",
+        "mmap_size = 268435456",
+        "temp_store = MEMORY",
+        "foreign_keys = ON",
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def connect(self):
+        db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None,
+                             factory=ProfiledConnection if PROFILING else sqlite3.Connection)
+        for pragma in self.PRAGMAS:
+            db.execute(f"PRAGMA {pragma}")
+        return db
+
+    def get(self):
+        db = getattr(self._local, 'connection', None)
+        if db is None:
+            db = self._local.connection = self.connect()
+        return db
+
+    def bind(self, db):
+        self._local.connection = db
+
+connections = ConnectionManager(DATABASE_PATH)
+
+# The calling thread's connection
+def connection():
+    return connections.get()
+
+# Point the calling thread at another database file (the synthetic ledger
+# generator and the benchmarks work on files of their own)
+def use_database(path):
+    db = ConnectionManager(path).connect()
+    connections.bind(db)
+    return db
+
+# Shared read cache for query results. Every write bumps the generation
+# counter, which drops all cached results. Between writes it keeps at most
+# max_entries results and evicts the least recently used one beyond that.
+class QueryCache:
+    def __init__(self, max_entries=256):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.max_entries = max_entries
+        self._listeners = []
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, loader):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == self.generation:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._detach(entry[1])
+            self.misses += 1
+            generation = self.generation
+        value = loader()
+        with self._lock:
+            # Only store the result if no write happened while it was loading
+            if generation == self.generation:
+                self._entries[key] = (generation, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return self._detach(value)
+
+    # notify=False is for writers (the background worker) that must not
+    # trigger the write listeners themselves
+    def invalidate(self, notify=True):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+        if notify:
+            for listener in self._listeners:
+                listener()
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'generation': self.generation, 'entries': len(self._entries)}
+
+    @staticmethod
+    def _detach(value):
+        # Callers add columns to the frames they get back, so hand out copies
+        if isinstance(value, tuple):
+            return tuple(QueryCache._detach(item) for item in value)
+        return value.copy() if hasattr(value, 'copy') else value
+
+query_cache = QueryCache(int(os.environ.get('FINANCE_TRACKER_CACHE_ENTRIES', 256)))
+
+def cached_query(func):
+    @functools.wraps(func)
+    def wrapper(*args):
+        return query_cache.get((func.__name__,) + args, lambda: func(*args))
+    return wrapper
+
+# Days since 1970-01-01 and integer cents, the stored forms of dates and money
+EPOCH_ORDINAL = datetime(1970, 1, 1).toordinal()
+NEVER = datetime(9999, 12, 31).toordinal() - EPOCH_ORDINAL
+
+# pandas is only imported by the first conversion, so code that never
+# converts (the reporting commands) starts without it
+def to_day(value):
+    import pandas as pd
+    return None if value is None or pd.isna(value) else pd.Timestamp(value).toordinal() - EPOCH_ORDINAL
+
+def to_cents(amount):
+    import pandas as pd
+    return None if amount is None or pd.isna(amount) else int(round(float(amount) * 100))
+
+# Key/value store for schema markers and job bookkeeping
+def get_meta(key, default=None, db=None):
+    row = (db or connection()).execute("SELECT value FROM app_meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+def set_meta(key, value, db=None):
+    (db or connection()).execute("INSERT INTO app_meta (key, value) VALUES (?, ?) "
+                                 "ON CONFLICT(key) DO UPDATE SET value = excluded.value", (key, value))
+
+# Explicit transaction: everything inside commits together or is rolled back.
+# Writers take the write lock up front (BEGIN IMMEDIATE), where busy_timeout
+# applies; a deferred transaction that reads and then writes fails at once
+# with 'database is locked' if another connection committed in between.
+# immediate=False is for read-only snapshots.
+@contextmanager
+def transaction(db=None, immediate=True):
+    db = db or connection()
+    db.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+    try:
+        yield db
+    except BaseException:
+        db.rollback()
+        raise
+    db.commit()
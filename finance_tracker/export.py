@@ -0,0 +1,85 @@
+import csv
+import gzip
+import io
+
+from .db import connection, to_day
+from .profiling import profiled
+
+# Streaming export. Rows come from the SQLite cursor in fixed-size chunks and
+# are written straight out, so peak memory does not depend on the table size.
+# Parquet needs the optional pyarrow package and gets one row group per chunk.
+# compression=None means uncompressed in either format, the same as 'none';
+# a compression the format does not support raises ValueError.
+EXPORT_COLUMNS = ('id', 'date', 'category', 'amount', 'description', 'type')
+EXPORT_CHUNK_SIZE = 50000
+CSV_COMPRESSIONS = ('none', 'gzip')
+PARQUET_COMPRESSIONS = ('snappy', 'gzip', 'zstd', 'brotli', 'lz4', 'none')
+
+def iter_export_chunks(user_id=None, start_date=None, end_date=None, categories=None, transaction_type=None,
+                       chunk_size=EXPORT_CHUNK_SIZE):
+    conditions, params = [], []
+    if user_id is not None:
+        conditions.append("user_id = ?")
+        params.append(user_id)
+    if start_date:
+        conditions.append("day >= ?")
+        params.append(to_day(start_date))
+    if end_date:
+        conditions.append("day <= ?")
+        params.append(to_day(end_date))
+    if categories:
+        conditions.append(f"category IN ({', '.join('?' * len(categories))})")
+        params.extend(categories)
+    if transaction_type:
+        conditions.append("type = ?")
+        params.append(transaction_type)
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+    cursor = connection().execute(f"SELECT {', '.join(EXPORT_COLUMNS)} FROM transactions_view{where} ORDER BY day, id", params)
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield rows
+
+@profiled
+def export_transactions(out, file_format='csv', compression=None, **filters):
+    written = 0
+    compression = compression or 'none'
+    if file_format == 'parquet':
+        if compression not in PARQUET_COMPRESSIONS:
+            raise ValueError(f"Parquet export supports {', '.join(map(repr, PARQUET_COMPRESSIONS))} compression, "
+                             f"not {compression!r}")
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError('Parquet export needs the pyarrow package')
+        schema = pa.schema([('id', pa.int64()), ('date', pa.string()), ('category', pa.string()),
+                            ('amount', pa.float64()), ('description', pa.string()), ('type', pa.string())])
+        with pq.ParquetWriter(out, schema, compression=compression) as writer:
+            for rows in iter_export_chunks(**filters):
+                writer.write_table(pa.Table.from_arrays([pa.array(column, type=field.type)
+                                                         for column, field in zip(zip(*rows), schema)], schema=schema))
+                written += len(rows)
+        return written
+    if compression not in CSV_COMPRESSIONS:
+        raise ValueError(f"CSV export supports 'gzip' compression or none, not {compression!r}")
+    if compression == 'gzip':
+        text = gzip.open(out, 'wt', newline='')
+    elif isinstance(out, str):
+        text = open(out, 'w', newline='')
+    else:
+        text = io.TextIOWrapper(out, newline='')
+    try:
+        writer = csv.writer(text)
+        writer.writerow(EXPORT_COLUMNS)
+        for rows in iter_export_chunks(**filters):
+            writer.writerows(rows)
+            written += len(rows)
+    finally:
+        if isinstance(text, io.TextIOWrapper) and not isinstance(out, str):
+            text.flush()
+            text.detach()
+        else:
+            text.close()
+    return written
@@ -0,0 +1,51 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from .db import get_meta, query_cache, set_meta, transaction
+from .profiling import profiled
+
+# Current balance in cents of each user, from the monthly rollup
+BALANCES_QUERY = """SELECT user_id, SUM(CASE type WHEN 'Income' THEN amount WHEN 'Expense' THEN -amount ELSE 0 END)
+                    FROM monthly_summary WHERE user_id IN (SELECT COALESCE(user_id, 0) FROM goals)
+                    GROUP BY user_id ORDER BY user_id"""
+
+def get_balances(db):
+    return pd.Series(dict(db.execute(BALANCES_QUERY).fetchall()), dtype=np.int64)
+
+# Fingerprint of everything the goal allocation depends on, for every user with goals
+def goal_allocation_fingerprint(db):
+    goals = db.execute("SELECT user_id, COUNT(*), SUM(current_amount), SUM(target_amount) "
+                       "FROM goals GROUP BY user_id ORDER BY user_id").fetchall()
+    balances = db.execute(BALANCES_QUERY).fetchall()
+    return hashlib.blake2b(repr((goals, balances)).encode(), digest_size=16).hexdigest()
+
+# Allocate each user's unallocated balance to their goals in proportion to
+# what each still needs, as one vectorized step over all users and one
+# executemany. Skipped when no balance or goal changed since the last run.
+@profiled
+def update_goals_with_balance(db):
+    fingerprint = goal_allocation_fingerprint(db)
+    if get_meta('goal_allocation_fingerprint', db=db) == fingerprint:
+        return 0
+    goals = pd.read_sql_query("SELECT id, COALESCE(user_id, 0) AS user_id, target_amount, current_amount FROM goals", db)
+    users = goals['user_id'].to_numpy(dtype=np.int64)
+    target = goals['target_amount'].fillna(0).to_numpy(dtype=np.int64)
+    current = goals['current_amount'].fillna(0).to_numpy(dtype=np.int64)
+    balance = goals['user_id'].map(get_balances(db)).fillna(0).to_numpy(dtype=np.int64)
+    allocated = pd.Series(current).groupby(users).transform('sum').to_numpy()
+    total_remaining = pd.Series(target).groupby(users).transform('sum').to_numpy() - allocated
+    unallocated_balance = np.maximum(0, balance - allocated)
+    remaining = target - current
+    funded = (unallocated_balance > 0) & (total_remaining > 0) & (remaining > 0)
+    # Whole cents, rounded down so the allocations never exceed the balance
+    share = np.where(funded, remaining / np.maximum(total_remaining, 1), 0)
+    allocation = np.minimum(remaining, np.floor(unallocated_balance * share).astype(np.int64))
+    updates = list(zip((current + allocation)[funded].tolist(), goals['id'][funded].tolist()))
+    with transaction(db):
+        db.executemany("UPDATE goals SET current_amount = ? WHERE id = ?", updates)
+        set_meta('goal_allocation_fingerprint', goal_allocation_fingerprint(db), db=db)
+    if updates:
+        query_cache.invalidate(notify=False)
+    return len(updates)
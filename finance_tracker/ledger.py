@@ -0,0 +1,363 @@
+import itertools
+import re
+
+import numpy as np
+import pandas as pd
+
+from .db import cached_query, connection, query_cache, to_cents, to_day, transaction
+from .profiling import profiled
+from .schedules import forecast_cash_flow
+from .schema import ensure_schema, index_search_backlog
+
+# Turn free text into an FTS5 query that prefix-matches every word
+def fts_query(text):
+    return ' '.join(f'"{token}"*' for token in re.findall(r'\w+', text))
+
+# Columnar load of one user's ledger. Every column here is stored as an integer, so
+# rows go from the cursor straight into one int64 array with no parsing; day
+# numbers view as datetime64[D] (missing dates become NaT) and type comes back
+# as codes into LEDGER_TYPES (-1 when unset).
+LEDGER_TYPES = ['Income', 'Expense']
+
+@profiled
+def load_ledger(user_id, db=None):
+    cursor = (db or connection()).execute("""SELECT id, COALESCE(date, -9223372036854775808), COALESCE(category_id, -1),
+                                                COALESCE(amount, 0),
+                                                CASE type WHEN 'Income' THEN 0 WHEN 'Expense' THEN 1 ELSE -1 END
+                                         FROM transactions WHERE user_id = ? ORDER BY id""", (user_id,))
+    rows = np.fromiter(itertools.chain.from_iterable(cursor), dtype=np.int64).reshape(-1, 5)
+    return {'id': rows[:, 0], 'date': rows[:, 1].astype('datetime64[D]'), 'category_id': rows[:, 2],
+            'amount': rows[:, 3], 'type': rows[:, 4]}
+
+# CRUD functions for goals
+@profiled
+def add_goal(user_id, name, target_amount, deadline):
+    with transaction() as db:
+        db.execute("INSERT INTO goals (name, target_amount, current_amount, deadline, user_id) VALUES (?, ?, ?, ?, ?)",
+                   (name, to_cents(target_amount), 0, to_day(deadline), user_id))
+    query_cache.invalidate()
+
+@profiled
+@cached_query
+def get_goals(user_id):
+    df = pd.read_sql_query("SELECT id, name, target_amount / 100.0 AS target_amount, "
+                           "current_amount / 100.0 AS current_amount, deadline FROM goals WHERE user_id = ?",
+                           connection(), params=(user_id,))
+    df['deadline'] = pd.to_datetime(df['deadline'], unit='D')
+    return df
+
+@profiled
+def update_goal(user_id, goal_id, name, target_amount, current_amount, deadline):
+    with transaction() as db:
+        db.execute("UPDATE goals SET name = ?, target_amount = ?, current_amount = ?, deadline = ? "
+                   "WHERE id = ? AND user_id = ?",
+                   (name, to_cents(target_amount), to_cents(current_amount), to_day(deadline), goal_id, user_id))
+    query_cache.invalidate()
+
+@profiled
+def delete_goal(user_id, goal_id):
+    with transaction() as db:
+        db.execute("DELETE FROM goals WHERE id = ? AND user_id = ?", (goal_id, user_id))
+    query_cache.invalidate()
+
+# CRUD functions for transactions
+TRANSACTION_COLUMNS = "t.id, t.day AS date, t.category, t.amount, t.description, t.type"
+CATEGORY_ASSIGNMENT = ("category_id = (SELECT c.id FROM categories c "
+                       "WHERE c.user_id = transactions.user_id AND c.name = ?)")
+
+@profiled
+def add_transaction(user_id, date, category, amount, description, transaction_type):
+    with transaction() as db:
+        db.execute("INSERT INTO transactions (date, category_id, amount, description, type, user_id) "
+                   "VALUES (?, (SELECT id FROM categories WHERE user_id = ? AND name = ?), ?, ?, ?, ?)",
+                   (to_day(date), user_id, category, to_cents(amount), description, transaction_type, user_id))
+    query_cache.invalidate()
+
+# The full ledger in memory, built from the columnar loader: category and
+# type are categoricals, so each row carries a small integer code instead
+# of its own copy of the string, and amount is in cents
+@profiled
+@cached_query
+def get_all_transactions(user_id):
+    with transaction(immediate=False) as db:
+        ledger = load_ledger(user_id, db)
+        descriptions = [row[0] for row in db.execute("SELECT description FROM transactions "
+                                                     "WHERE user_id = ? ORDER BY id", (user_id,))]
+    names = pd.read_sql_query("SELECT id, name FROM categories WHERE user_id = ? ORDER BY name",
+                              connection(), params=(user_id,))
+    return pd.DataFrame({
+        'id': ledger['id'],
+        'date': ledger['date'].astype('datetime64[ns]'),
+        'category': pd.Categorical.from_codes(pd.Index(names['id']).get_indexer(ledger['category_id']),
+                                              categories=names['name']),
+        'amount': ledger['amount'],
+        'description': descriptions,
+        'type': pd.Categorical.from_codes(ledger['type'], categories=LEDGER_TYPES),
+    })
+
+@profiled
+def delete_transaction(user_id, transaction_id):
+    with transaction() as db:
+        db.execute("DELETE FROM transactions WHERE id = ? AND user_id = ?", (transaction_id, user_id))
+    query_cache.invalidate()
+
+@profiled
+def update_transaction(user_id, transaction_id, date, category, amount, description, transaction_type):
+    with transaction() as db:
+        db.execute(f"UPDATE transactions SET date = ?, {CATEGORY_ASSIGNMENT}, "
+                   "amount = ?, description = ?, type = ? WHERE id = ? AND user_id = ?",
+                   (to_day(date), category, to_cents(amount), description, transaction_type, transaction_id, user_id))
+    query_cache.invalidate()
+
+# Search by text (ranked FTS5 match) and amount/date ranges (indexed predicates).
+# CROSS JOIN keeps the FTS match as the outer loop; otherwise the planner may
+# walk a date range on the user index and re-run the MATCH for every row.
+def transaction_filters(user_id, query, min_amount, max_amount, start_date, end_date):
+    source, conditions, params = "transactions_view t", ["t.user_id = ?"], [user_id]
+    match = fts_query(query)
+    if match and ensure_schema():
+        index_search_backlog()
+        source = "transactions_fts CROSS JOIN transactions_view t ON t.id = transactions_fts.rowid"
+        conditions.append("transactions_fts MATCH ?")
+        params.append(match)
+    elif match:
+        for token in re.findall(r'\w+', query):
+            conditions.append("(t.description LIKE ? OR t.category LIKE ?)")
+            params.extend([f'%{token}%'] * 2)
+    if min_amount is not None:
+        conditions.append("t.cents >= ?")
+        params.append(to_cents(min_amount))
+    if max_amount is not None:
+        conditions.append("t.cents <= ?")
+        params.append(to_cents(max_amount))
+    if start_date is not None:
+        conditions.append("t.day >= ?")
+        params.append(to_day(start_date))
+    if end_date is not None:
+        conditions.append("t.day <= ?")
+        params.append(to_day(end_date))
+    return source, conditions, params
+
+# One page of transactions. Date orders use keyset pagination on (day, id),
+# so the cursor is the (day, id) of the last row shown; 'Best match' pages
+# through the FTS rank by offset. Returns the page and the next cursor.
+# Without a full-text match there is no rank, and 'Best match' falls back
+# to newest first.
+@profiled
+@cached_query
+def get_transactions_page(user_id, page_size, order, cursor=None, query='', min_amount=None, max_amount=None,
+                          start_date=None, end_date=None):
+    source, conditions, params = transaction_filters(user_id, query, min_amount, max_amount, start_date, end_date)
+    if order == 'Best match' and 'transactions_fts' not in source:
+        order = 'Newest first'
+    if order == 'Best match':
+        order_by = "transactions_fts.rank LIMIT ? OFFSET ?"
+        limit = [page_size + 1, cursor or 0]
+    else:
+        descending = order == 'Newest first'
+        if cursor is not None:
+            conditions.append(f"(t.day, t.id) {'<' if descending else '>'} (?, ?)")
+            params.extend(cursor)
+        direction = 'DESC' if descending else 'ASC'
+        order_by = f"t.day {direction}, t.id {direction} LIMIT ?"
+        limit = [page_size + 1]
+    where = " WHERE " + " AND ".join(conditions)
+    df = pd.read_sql_query(f"SELECT {TRANSACTION_COLUMNS} FROM {source}{where} ORDER BY {order_by}",
+                           connection(), params=params + limit)
+    next_cursor = None
+    if len(df) > page_size:
+        df = df.iloc[:page_size]
+        if order == 'Best match':
+            next_cursor = (cursor or 0) + page_size
+        else:
+            next_cursor = (int(df['date'].iloc[-1]), int(df['id'].iloc[-1]))
+    df['date'] = pd.to_datetime(df['date'], unit='D')
+    return df, next_cursor
+
+# Cursor that starts a date-ordered page at the given day
+def date_cursor(day, order):
+    if order == 'Newest first':
+        return (to_day(day) + 1, 0)
+    return (to_day(day), 0)
+
+# Aggregations read from the monthly_summary rollup instead of the ledger.
+# Totals by type stay in integer cents, so the balance is exact.
+@profiled
+@cached_query
+def get_totals_by_type(user_id):
+    return pd.read_sql_query("SELECT type, SUM(amount) AS amount, SUM(count) AS count "
+                             "FROM monthly_summary WHERE user_id = ? GROUP BY type", connection(), params=(user_id,))
+
+@profiled
+@cached_query
+def get_category_totals(user_id, transaction_type):
+    return pd.read_sql_query("SELECT c.name AS category, SUM(s.amount) / 100.0 AS amount "
+                             "FROM monthly_summary s LEFT JOIN categories c ON c.id = s.category_id "
+                             "WHERE s.user_id = ? AND s.type = ? GROUP BY s.category_id ORDER BY amount DESC",
+                             connection(), params=(user_id, transaction_type))
+
+@profiled
+@cached_query
+def get_monthly_totals(user_id):
+    return pd.read_sql_query("SELECT month, type, SUM(amount) / 100.0 AS amount FROM monthly_summary "
+                             "WHERE user_id = ? AND month != '' GROUP BY month, type ORDER BY month",
+                             connection(), params=(user_id,))
+
+@profiled
+@cached_query
+def get_recent_transactions(user_id, limit):
+    df = pd.read_sql_query("SELECT id, day AS date, category, amount, description, type "
+                           "FROM transactions_view WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                           connection(), params=(user_id, limit))
+    df['date'] = pd.to_datetime(df['date'], unit='D')
+    return df.iloc[::-1]
+
+# Chart data. Figures only ever receive aggregated points, so their payload
+# does not grow with the history: the pie gets the top categories plus an
+# 'Other' bucket, and the trend at most MAX_TREND_POINTS buckets per type.
+# Daily and weekly buckets widen to whole multiples of a day or week when
+# the history is too long. Daily and weekly points come from the daily
+# rollup, monthly ones from the monthly rollup.
+TOP_CATEGORIES = 8
+MAX_TREND_POINTS = 180
+TREND_RESOLUTIONS = {'Daily': 1, 'Weekly': 7, 'Monthly': None}
+
+@profiled
+@cached_query
+def get_category_breakdown(user_id, transaction_type, top_n=TOP_CATEGORIES):
+    totals = get_category_totals(user_id, transaction_type)
+    totals['category'] = totals['category'].fillna('Uncategorized')
+    if len(totals) > top_n + 1:
+        other = pd.DataFrame({'category': ['Other'], 'amount': [totals['amount'].iloc[top_n:].sum()]})
+        totals = pd.concat([totals.iloc[:top_n], other], ignore_index=True)
+    return totals
+
+# Income and expense per period, and the number of days each point covers
+# (None for months)
+@profiled
+@cached_query
+def get_trend(user_id, resolution):
+    days = TREND_RESOLUTIONS[resolution]
+    if days is None:
+        totals = get_monthly_totals(user_id)
+        totals['period'] = pd.to_datetime(totals['month'], format='%Y-%m')
+    else:
+        first, last = connection().execute("SELECT MIN(day), MAX(day) FROM daily_summary WHERE user_id = ?",
+                                           (user_id,)).fetchone()
+        if first is not None:
+            days *= max(1, -(-(last - first + 1) // (days * MAX_TREND_POINTS)))
+        # Day numbers shifted by 3 put bucket boundaries on Mondays
+        totals = pd.read_sql_query("SELECT ((day + 3) / ?) * ? - 3 AS period, type, SUM(amount) / 100.0 AS amount "
+                                   "FROM daily_summary WHERE user_id = ? GROUP BY 1, 2",
+                                   connection(), params=(days, days, user_id))
+        totals['period'] = pd.to_datetime(totals['period'], unit='D')
+    trend = (totals.pivot_table(index='period', columns='type', values='amount', aggfunc='sum')
+             .reindex(columns=['Income', 'Expense']))
+    return trend, days
+
+# Total income, expenses and balance, in cents
+@profiled
+def get_statistics(user_id):
+    totals = get_totals_by_type(user_id)
+    if totals['count'].sum() > 0:
+        totals = totals.set_index('type')['amount']
+        income = int(totals.get('Income', 0))
+        expenses = int(totals.get('Expense', 0))
+        return income, expenses, income - expenses
+    return 0, 0, 0
+
+# Projected balance from today over the next `months`, downsampled to at
+# most MAX_TREND_POINTS points that keep each bucket's low, plus goal
+# completion dates and the days the balance goes below zero. `today` is a
+# day number so the cached forecast rolls over at midnight.
+@profiled
+@cached_query
+def get_forecast(user_id, months, today):
+    schedules = pd.read_sql_query("SELECT date, anchor_date, frequency, amount, type FROM scheduled_transactions "
+                                  "WHERE user_id = ? AND date IS NOT NULL", connection(), params=(user_id,))
+    goals = pd.read_sql_query("SELECT id, name, target_amount, deadline FROM goals WHERE user_id = ?",
+                              connection(), params=(user_id,))
+    start = np.datetime64(today, 'D')
+    days, projected, goals, below_zero = forecast_cash_flow(
+        schedules, goals, get_statistics(user_id)[2], start, months)
+    buckets = np.arange(0, len(days), -(-len(days) // MAX_TREND_POINTS))
+    lowest = projected.argmin()
+    forecast = pd.DataFrame({'date': days[buckets], 'balance': np.minimum.reduceat(projected, buckets) / 100.0})
+    goals['target_amount'] = goals['target_amount'] / 100.0
+    goals['deadline'] = pd.to_datetime(goals['deadline'], unit='D')
+    goals['on_track'] = goals['reached'].notna() & ~(goals['reached'] > goals['deadline'])
+    return forecast, (days[lowest], projected[lowest] / 100.0), goals, below_zero
+
+# CRUD functions for categories
+@profiled
+@cached_query
+def get_categories(user_id):
+    return pd.read_sql_query("SELECT id, name FROM categories WHERE user_id = ?", connection(), params=(user_id,))
+
+@profiled
+def add_category(user_id, name):
+    with transaction() as db:
+        db.execute("INSERT INTO categories (name, user_id) VALUES (?, ?)", (name, user_id))
+    query_cache.invalidate()
+
+@profiled
+def update_category(user_id, category_id, new_name):
+    with transaction() as db:
+        db.execute("UPDATE categories SET name = ? WHERE id = ? AND user_id = ?", (new_name, category_id, user_id))
+    query_cache.invalidate()
+
+@profiled
+def delete_category(user_id, category_id):
+    with transaction() as db:
+        db.execute("DELETE FROM categories WHERE id = ? AND user_id = ?", (category_id, user_id))
+    query_cache.invalidate()
+
+# Functions for scheduled transactions
+@profiled
+def add_scheduled_transaction(user_id, date, category, amount, description, transaction_type, frequency):
+    with transaction() as db:
+        db.execute("INSERT INTO scheduled_transactions (date, category, amount, description, type, frequency, user_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                   (to_day(date), category, to_cents(amount), description, transaction_type, frequency, user_id))
+    query_cache.invalidate()
+
+@profiled
+@cached_query
+def get_scheduled_transactions(user_id):
+    df = pd.read_sql_query("SELECT id, date, category, amount / 100.0 AS amount, description, type, frequency "
+                           "FROM scheduled_transactions WHERE user_id = ?", connection(), params=(user_id,))
+    df['date'] = pd.to_datetime(df['date'], unit='D')
+    return df
+
+@profiled
+def update_scheduled_transaction(user_id, transaction_id, date, category, amount, description, transaction_type, frequency):
+    with transaction() as db:
+        db.execute("UPDATE scheduled_transactions SET date = ?, category = ?, amount = ?, description = ?, type = ?, frequency = ? WHERE id = ? AND user_id = ?",
+                   (to_day(date), category, to_cents(amount), description, transaction_type, frequency, transaction_id, user_id))
+    query_cache.invalidate()
+
+@profiled
+def delete_scheduled_transaction(user_id, transaction_id):
+    with transaction() as db:
+        db.execute("DELETE FROM scheduled_transactions WHERE id = ? AND user_id = ?", (transaction_id, user_id))
+    query_cache.invalidate()
+
+# Write-back of a batch of editor changes in one transaction, with one
+# executemany per set of changed columns. `updates` maps a tuple of column
+# names to rows of (values..., id); `deletes` is a list of ids. Only rows in
+# the user's partition are touched. Returns the number of rows changed.
+@profiled
+def apply_edits(user_id, table, updates, deletes, assignments=None):
+    assignments = assignments or {}
+    changed = 0
+    try:
+        with transaction() as db:
+            for changed_columns, rows in updates.items():
+                updates_sql = ', '.join(assignments.get(column, f'{column} = ?') for column in changed_columns)
+                changed += db.executemany(f"UPDATE {table} SET {updates_sql} WHERE id = ? AND user_id = ?",
+                                          [tuple(row) + (user_id,) for row in rows]).rowcount
+            if deletes:
+                changed += db.executemany(f"DELETE FROM {table} WHERE id = ? AND user_id = ?",
+                                          [(row_id, user_id) for row_id in deletes]).rowcount
+    finally:
+        query_cache.invalidate()
+    return changed
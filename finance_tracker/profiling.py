@@ -0,0 +1,213 @@
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+# Opt-in profiling, switched on with FINANCE_TRACKER_PROFILE=1. While it is
+# off, profiled() hands functions back unwrapped and connections are plain
+# sqlite3 connections, so nothing is measured and nothing is paid for.
+# While it is on, each rerun (or any other stretch between start() and
+# finish()) records every statement run on the thread's connections, with
+# its duration and rows, and every profiled function and span, with the time
+# spent in SQL inside it. finish() appends the record as one JSON line to a
+# rotating log.
+ENABLED = os.environ.get('FINANCE_TRACKER_PROFILE', '') not in ('', '0')
+LOG_PATH = os.environ.get('FINANCE_TRACKER_PROFILE_LOG', 'finance_tracker_profile.log')
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUPS = 3
+MAX_SQL_LENGTH = 500
+
+_local = threading.local()
+_log_lock = threading.Lock()
+_logger = None
+
+class Recorder:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = []
+        self.calls = []
+        # [name, SQL seconds] of each function or span still running
+        self.stack = []
+
+    def add_sql_time(self, seconds):
+        if self.stack:
+            self.stack[-1][1] += seconds
+
+def current():
+    return getattr(_local, 'recorder', None)
+
+def start():
+    _local.recorder = Recorder()
+    return _local.recorder
+
+# Ends the calling thread's recording, logs it under `label` and returns the report
+def finish(label):
+    recorder = current()
+    if recorder is None:
+        return None
+    _local.recorder = None
+    report = {
+        'time': datetime.now().isoformat(timespec='milliseconds'),
+        'label': label,
+        'total_ms': (time.perf_counter() - recorder.started) * 1000,
+        'sql_ms': sum(query['ms'] for query in recorder.queries),
+        'queries': recorder.queries,
+        'calls': recorder.calls,
+    }
+    write_log(report)
+    return report
+
+def write_log(report):
+    global _logger
+    with _log_lock:
+        if _logger is None:
+            handler = logging.handlers.RotatingFileHandler(LOG_PATH, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            _logger = logging.getLogger('finance_tracker.profile')
+            _logger.setLevel(logging.INFO)
+            _logger.propagate = False
+            _logger.addHandler(handler)
+    _logger.info(json.dumps(report, default=str))
+
+# Times a block of code that is not a function of its own, e.g. building a chart
+def span(name):
+    if not ENABLED:
+        return nullcontext()
+    return _span(name)
+
+@contextmanager
+def _span(name):
+    recorder = current()
+    if recorder is None:
+        yield
+        return
+    frame = [name, 0.0]
+    recorder.stack.append(frame)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started
+        recorder.stack.pop()
+        recorder.calls.append({'name': name, 'ms': duration * 1000, 'sql_ms': frame[1] * 1000,
+                               'depth': len(recorder.stack)})
+        # SQL time counts towards every enclosing call too
+        recorder.add_sql_time(frame[1])
+
+def profiled(func):
+    if not ENABLED:
+        return func
+    name = f'{func.__module__.rpartition(".")[2]}.{func.__qualname__}'
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with _span(name):
+            return func(*args, **kwargs)
+    return wrapper
+
+# Cursor that records each statement's execution and fetch time and the rows
+# it returned (or changed, for writes)
+class ProfiledCursor(sqlite3.Cursor):
+    _entry = None
+
+    def execute(self, sql, parameters=()):
+        return self._timed(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._timed(super().executemany, sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self._timed(super().executescript, sql_script)
+
+    def _timed(self, method, sql, *args):
+        recorder = current()
+        if recorder is None:
+            self._entry = None
+            return method(sql, *args)
+        started = time.perf_counter()
+        try:
+            return method(sql, *args)
+        finally:
+            duration = time.perf_counter() - started
+            self._entry = {'sql': ' '.join(sql.split())[:MAX_SQL_LENGTH], 'ms': duration * 1000,
+                           'rows': max(self.rowcount, 0) if self.description is None else 0,
+                           'function': recorder.stack[-1][0] if recorder.stack else None}
+            recorder.queries.append(self._entry)
+            recorder.add_sql_time(duration)
+
+    def _fetched(self, started, rows):
+        duration = time.perf_counter() - started
+        self._entry['ms'] += duration * 1000
+        self._entry['rows'] += rows
+        recorder = current()
+        if recorder is not None:
+            recorder.add_sql_time(duration)
+
+    def fetchone(self):
+        if self._entry is None:
+            return super().fetchone()
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        if self._entry is None:
+            return super().fetchmany(size or self.arraysize)
+        started = time.perf_counter()
+        rows = super().fetchmany(size or self.arraysize)
+        self._fetched(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        if self._entry is None:
+            return super().fetchall()
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows))
+        return rows
+
+    def __next__(self):
+        if self._entry is None:
+            return super().__next__()
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+# Connection whose cursors (including the ones execute() makes) are profiled
+class ProfiledConnection(sqlite3.Connection):
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+# Per-function and per-statement totals of a report, slowest first
+def summarize(report, limit=20):
+    functions = {}
+    for call in report['calls']:
+        total = functions.setdefault(call['name'], {'name': call['name'], 'calls': 0, 'ms': 0.0, 'sql_ms': 0.0})
+        total['calls'] += 1
+        total['ms'] += call['ms']
+        total['sql_ms'] += call['sql_ms']
+    statements = {}
+    for query in report['queries']:
+        total = statements.setdefault(query['sql'], {'sql': query['sql'], 'function': query['function'], 'calls': 0,
+                                                     'ms': 0.0, 'rows': 0})
+        total['calls'] += 1
+        total['ms'] += query['ms']
+        total['rows'] += query['rows']
+    return (sorted(functions.values(), key=lambda total: -total['ms'])[:limit],
+            sorted(statements.values(), key=lambda total: -total['ms'])[:limit])
@@ -0,0 +1,36 @@
+from .db import connection
+
+# Reports for the command line. They read the monthly_summary rollup with
+# plain sqlite3, so printing them needs neither pandas nor numpy. Amounts are
+# in cents.
+SIGNED_AMOUNT = "CASE s.type WHEN 'Income' THEN s.amount WHEN 'Expense' THEN -s.amount ELSE 0 END"
+
+# (username, income, expenses, balance) for every user
+def user_balances():
+    return connection().execute(f"""SELECT u.username,
+                                           COALESCE(SUM(CASE s.type WHEN 'Income' THEN s.amount END), 0),
+                                           COALESCE(SUM(CASE s.type WHEN 'Expense' THEN s.amount END), 0),
+                                           COALESCE(SUM({SIGNED_AMOUNT}), 0)
+                                    FROM users u LEFT JOIN monthly_summary s ON s.user_id = u.id
+                                    GROUP BY u.id ORDER BY u.username""").fetchall()
+
+# (month, income, expenses, net) for the user's last `months` months, oldest first
+def monthly_totals(user_id, months=12):
+    rows = connection().execute(f"""SELECT s.month,
+                                           COALESCE(SUM(CASE s.type WHEN 'Income' THEN s.amount END), 0),
+                                           COALESCE(SUM(CASE s.type WHEN 'Expense' THEN s.amount END), 0),
+                                           SUM({SIGNED_AMOUNT})
+                                    FROM monthly_summary s WHERE s.user_id = ? AND s.month != ''
+                                    GROUP BY s.month ORDER BY s.month DESC LIMIT ?""", (user_id, months)).fetchall()
+    return rows[::-1]
+
+# (month, category, type, amount) for the user's last `months` months
+def monthly_category_totals(user_id, months=12):
+    return connection().execute("""SELECT s.month, COALESCE(c.name, 'Uncategorized'), s.type, SUM(s.amount)
+                                   FROM monthly_summary s LEFT JOIN categories c ON c.id = s.category_id
+                                   WHERE s.user_id = ? AND s.month IN (SELECT DISTINCT month FROM monthly_summary
+                                                                      WHERE user_id = ? AND month != ''
+                                                                      ORDER BY month DESC LIMIT ?)
+                                   GROUP BY s.month, s.category_id, s.type
+                                   ORDER BY s.month, s.type, SUM(s.amount) DESC""",
+                                (user_id, user_id, months)).fetchall()
@@ -0,0 +1,138 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from .db import NEVER, get_meta, query_cache, set_meta, to_day, transaction
+from .profiling import profiled
+
+# Calendar arithmetic for recurring schedules on datetime64[D] arrays.
+# Occurrence k of a schedule is its anchor plus k weeks, months or years;
+# month and year steps clamp the day to the length of the target month.
+MONTH_STEPS = {'Monthly': 1, 'Yearly': 12}
+
+# Months between occurrences of each schedule (0 for weekly and one-time)
+def month_steps(frequencies):
+    return np.array([MONTH_STEPS.get(frequency, 0) for frequency in frequencies], dtype=np.int64)
+
+# Occurrence k of each schedule; `index` picks the schedule of each k when
+# there are several per schedule. Calendar conversions run once per schedule
+# and once per distinct target month, never per occurrence.
+def nth_occurrence(anchors, months, k, index=slice(None)):
+    anchor_months = anchors.astype('datetime64[M]')
+    day = (anchors - anchor_months.astype('datetime64[D]')).astype(np.int64)[index]
+    target = anchor_months.astype(np.int64)[index] + k * months[index]
+    weekly = anchors.astype(np.int64)[index] + k * 7
+    if len(target):
+        first_month = target.min()
+        month_starts = np.arange(first_month, target.max() + 2).astype('datetime64[M]').astype('datetime64[D]').astype(np.int64)
+        start_days = month_starts[target - first_month]
+        month_length = month_starts[target - first_month + 1] - start_days
+        weekly = np.where(months[index] > 0, start_days + np.minimum(day, month_length - 1), weekly)
+    return weekly.astype('datetime64[D]')
+
+# Index of the last period starting on or before each date (may be one too low
+# for month steps; callers mask by date)
+def period_index(anchors, months, dates):
+    weeks = (dates - anchors).astype(np.int64) // 7
+    month_diff = (dates.astype('datetime64[M]') - anchors.astype('datetime64[M]')).astype(np.int64)
+    return np.where(months > 0, month_diff // np.maximum(months, 1), weeks)
+
+# Every occurrence between each schedule's next date and `until` in one pass.
+# Returns the schedule positions and occurrence dates, plus the next date due
+# after `until` for each schedule (NaT for one-time schedules).
+def expand_occurrences(anchors, starts, frequencies, until):
+    months = month_steps(frequencies)
+    recurring = (frequencies == 'Weekly') | (months > 0)
+    first = np.where(recurring, period_index(anchors, months, starts), 0)
+    last = np.where(recurring, period_index(anchors, months, np.full_like(starts, until)), 0)
+    counts = np.maximum(last - first + 1, 0)
+    positions = np.repeat(np.arange(len(starts)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    k = np.repeat(first, counts) + offsets
+    dates = np.where(recurring[positions], nth_occurrence(anchors, months, k, positions), starts[positions])
+    keep = (dates >= starts[positions]) & (dates <= until)
+    at_last = nth_occurrence(anchors, months, last)
+    next_due = np.where(at_last > until, at_last, nth_occurrence(anchors, months, last + 1))
+    next_due = np.where(starts > until, starts, next_due)
+    next_due = np.where(recurring, next_due, np.datetime64('NaT'))
+    return positions[keep], dates[keep], next_due
+
+# Catch-up engine: posts every occurrence due up to today in one batch. The
+# (schedule_id, occurrence_date) unique index makes reruns and concurrent
+# sessions idempotent, and the stored 'scheduled_next_due' watermark skips
+# the work entirely while nothing is due.
+@profiled
+def process_scheduled_transactions(db):
+    today = to_day(datetime.now().date())
+    next_due = get_meta('scheduled_next_due', db=db)
+    if next_due is not None and int(next_due) > today:
+        return 0
+    scheduled = pd.read_sql_query("SELECT * FROM scheduled_transactions WHERE date <= ?", db, params=(today,))
+    posted = 0
+    if not scheduled.empty:
+        # Day numbers view as datetime64[D] directly
+        starts = scheduled['date'].to_numpy(dtype=np.int64).astype('datetime64[D]')
+        anchors = scheduled['anchor_date'].fillna(scheduled['date']).to_numpy(dtype=np.int64).astype('datetime64[D]')
+        frequencies = scheduled['frequency'].fillna('One-time').to_numpy(dtype=object)
+        positions, dates, next_due_dates = expand_occurrences(anchors, starts, frequencies,
+                                                              np.datetime64(today, 'D'))
+        occurrence_days = dates.astype(np.int64).tolist()
+        columns = scheduled.iloc[positions]
+        owners = columns['user_id'].tolist()
+        postings = list(zip(occurrence_days, owners, columns['category'], columns['amount'].tolist(),
+                            columns['description'], columns['type'], columns['id'].tolist(), occurrence_days, owners))
+        last_posted = pd.Series(occurrence_days, dtype=np.int64).groupby(positions).max().to_dict()
+        advances, finished = [], []
+        for position, row in enumerate(scheduled.itertuples()):
+            if np.isnat(next_due_dates[position]):
+                finished.append((row.id, row.date))
+            else:
+                advances.append((int(next_due_dates[position].astype(np.int64)),
+                                 last_posted.get(position, None if pd.isna(row.last_posted) else int(row.last_posted)),
+                                 row.id, row.date))
+        with transaction(db):
+            posted = db.executemany("INSERT OR IGNORE INTO transactions (date, category_id, amount, description, "
+                                    "type, schedule_id, occurrence_date, user_id) "
+                                    "VALUES (?, (SELECT id FROM categories WHERE user_id = ? AND name = ?), "
+                                    "?, ?, ?, ?, ?, ?)",
+                                    postings).rowcount
+            # Matching on the old date leaves schedules another session already advanced alone
+            db.executemany("UPDATE scheduled_transactions SET date = ?, last_posted = ? WHERE id = ? AND date = ?",
+                           advances)
+            db.executemany("DELETE FROM scheduled_transactions WHERE id = ? AND date = ?", finished)
+        query_cache.invalidate(notify=False)
+    next_due = db.execute("SELECT MIN(date) FROM scheduled_transactions").fetchone()[0]
+    set_meta('scheduled_next_due', NEVER if next_due is None else next_due, db=db)
+    return posted
+
+# Cash-flow forecast. Every schedule is expanded over the horizon in one
+# vectorized pass (expand_occurrences); occurrences are summed per day with
+# bincount and accumulated onto the starting balance. Occurrences already due
+# but not yet posted land on the first day. Goals, in deadline order, are
+# reached on the first day the projected balance covers their cumulative
+# targets. Amounts are in cents, dates are datetime64[D].
+@profiled
+def forecast_cash_flow(schedules, goals, balance, start, months):
+    start = np.datetime64(start, 'D')
+    until = np.datetime64((pd.Timestamp(start) + pd.DateOffset(months=months)).date(), 'D')
+    days = np.arange(start, until + 1)
+    flows = np.zeros(len(days))
+    if len(schedules):
+        starts = schedules['date'].to_numpy(dtype=np.int64).astype('datetime64[D]')
+        anchors = schedules['anchor_date'].fillna(schedules['date']).to_numpy(dtype=np.int64).astype('datetime64[D]')
+        frequencies = schedules['frequency'].fillna('One-time').to_numpy(dtype=object)
+        positions, dates, _ = expand_occurrences(anchors, starts, frequencies, until)
+        types = schedules['type'].to_numpy(dtype=object)
+        signed = schedules['amount'].fillna(0).to_numpy(dtype=np.int64) * np.select(
+            [types == 'Income', types == 'Expense'], [1, -1], 0)
+        flows = np.bincount(np.maximum((dates - start).astype(np.int64), 0), weights=signed[positions],
+                            minlength=len(days))
+    projected = balance + np.cumsum(flows).round().astype(np.int64)
+    goals = goals.sort_values('deadline', na_position='last').reset_index(drop=True)
+    reached = np.searchsorted(np.maximum.accumulate(projected),
+                              goals['target_amount'].fillna(0).to_numpy(dtype=np.int64).cumsum())
+    goals['reached'] = np.where(reached < len(days), days[np.minimum(reached, len(days) - 1)], np.datetime64('NaT'))
+    negative = projected < 0
+    below_zero = days[negative & ~np.concatenate(([False], negative[:-1]))]
+    return days, projected, goals, below_zero
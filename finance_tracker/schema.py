@@ -0,0 +1,457 @@
+import sqlite3
+import threading
+import warnings
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from .db import connection, get_meta, set_meta, transaction
+from .profiling import profiled
+
+# Transactions reference their category by id, so renaming a category renames
+# it everywhere and deleting one leaves its transactions uncategorized.
+# Money is stored as integer cents and dates as days since 1970-01-01, so
+# sums are exact and columns load straight into int64 and datetime64[D]
+# arrays. transactions_view joins the category name back in and adds the
+# display date and amount for readers; day and cents stay filterable.
+TRANSACTIONS_TABLE = '''CREATE TABLE {name}
+                        (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                         date INTEGER,
+                         category_id INTEGER REFERENCES categories (id) ON DELETE SET NULL,
+                         amount INTEGER,
+                         description TEXT,
+                         type TEXT,
+                         schedule_id INTEGER,
+                         occurrence_date INTEGER,
+                         content_hash INTEGER,
+                         user_id INTEGER REFERENCES users (id))'''
+
+GOALS_TABLE = '''CREATE TABLE {name}
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  name TEXT,
+                  target_amount INTEGER,
+                  current_amount INTEGER,
+                  deadline INTEGER,
+                  user_id INTEGER REFERENCES users (id))'''
+
+SCHEDULED_TRANSACTIONS_TABLE = '''CREATE TABLE {name}
+                                  (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                   date INTEGER,
+                                   category TEXT,
+                                   amount INTEGER,
+                                   description TEXT,
+                                   type TEXT,
+                                   frequency TEXT,
+                                   anchor_date INTEGER,
+                                   last_posted INTEGER,
+                                   user_id INTEGER REFERENCES users (id))'''
+
+# Category names are unique per user
+CATEGORIES_TABLE = '''CREATE TABLE {name}
+                      (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                       name TEXT,
+                       user_id INTEGER REFERENCES users (id),
+                       UNIQUE (user_id, name))'''
+
+TRANSACTIONS_VIEW = '''SELECT t.id, date(t.date + 2440587.5) AS date, c.name AS category, t.amount / 100.0 AS amount,
+                             t.description, t.type, t.date AS day, t.amount AS cents, t.category_id,
+                             t.schedule_id, t.occurrence_date, t.content_hash, t.user_id
+                      FROM transactions t LEFT JOIN categories c ON c.id = t.category_id'''
+
+# Conversions from the older text/REAL layout
+TEXT_TO_DAY = "CAST(julianday(substr({0}, 1, 10)) - 2440587.5 AS INTEGER)"
+REAL_TO_CENTS = "CAST(ROUND({0} * 100) AS INTEGER)"
+
+def table_columns(table):
+    db = connection()
+    return {column[1]: column[2] for column in db.execute(f"PRAGMA table_info({table})")}
+
+def rebuild_table(name, create, select):
+    db = connection()
+    db.execute(create.format(name=f'{name}_new'))
+    db.execute(f"INSERT INTO {name}_new {select}")
+    db.execute(f"DROP TABLE {name}")
+    db.execute(f"ALTER TABLE {name}_new RENAME TO {name}")
+
+# One-off rebuild of tables stored in an older layout: category names on
+# transactions, text dates and REAL amounts, and no owning user. Rows that
+# predate users belong to the first registered user (see add_user()).
+# Everything derived from these tables (view, rollup, search index, triggers,
+# watermarks) is dropped here and recreated by migrate_database().
+PARTITIONED_TABLES = ('categories', 'transactions', 'goals', 'scheduled_transactions')
+
+def upgrade_tables():
+    db = connection()
+    categories, transactions, goals, scheduled = (table_columns(table) for table in PARTITIONED_TABLES)
+    upgrade_transactions = transactions['date'] != 'INTEGER'
+    upgrade_goals = goals['target_amount'] != 'INTEGER'
+    upgrade_scheduled = scheduled['amount'] != 'INTEGER'
+    unowned = [table for table, columns in zip(PARTITIONED_TABLES, (categories, transactions, goals, scheduled))
+               if 'user_id' not in columns]
+    if not (upgrade_transactions or upgrade_goals or upgrade_scheduled or unowned):
+        return
+    # Dropping the old categories table must not null out category_id
+    db.execute("PRAGMA foreign_keys = OFF")
+    try:
+        with transaction(db):
+            db.execute("DROP VIEW IF EXISTS transactions_view")
+            db.execute("DROP TRIGGER IF EXISTS categories_rename")
+            drop_monthly_summary(db)
+            drop_transaction_search(db)
+            db.execute("DELETE FROM app_meta WHERE key IN ('monthly_summary_version', 'transactions_fts_version', "
+                         "'scheduled_next_due', 'goal_allocation_fingerprint')")
+            if upgrade_transactions:
+                category_id, join = 't.category_id', ''
+                if 'category' in transactions:
+                    db.execute("INSERT OR IGNORE INTO categories (name) "
+                                 "SELECT DISTINCT category FROM transactions WHERE category IS NOT NULL")
+                    category_id, join = 'c.id', ' LEFT JOIN categories c ON c.name = t.category'
+                rebuild_table('transactions', TRANSACTIONS_TABLE,
+                              f"""SELECT t.id, {TEXT_TO_DAY.format('t.date')}, {category_id},
+                                         {REAL_TO_CENTS.format('t.amount')}, t.description, t.type, t.schedule_id,
+                                         {TEXT_TO_DAY.format('t.occurrence_date')}, t.content_hash, NULL
+                                  FROM transactions t{join}""")
+            if upgrade_goals:
+                rebuild_table('goals', GOALS_TABLE,
+                              f"""SELECT id, name, {REAL_TO_CENTS.format('target_amount')},
+                                         {REAL_TO_CENTS.format('current_amount')}, {TEXT_TO_DAY.format('deadline')}, NULL
+                                  FROM goals""")
+            if upgrade_scheduled:
+                rebuild_table('scheduled_transactions', SCHEDULED_TRANSACTIONS_TABLE,
+                              f"""SELECT id, {TEXT_TO_DAY.format('date')}, category, {REAL_TO_CENTS.format('amount')},
+                                         description, type, frequency, {TEXT_TO_DAY.format('anchor_date')},
+                                         {TEXT_TO_DAY.format('last_posted')}, NULL
+                                  FROM scheduled_transactions""")
+            if 'categories' in unowned:
+                rebuild_table('categories', CATEGORIES_TABLE, "SELECT id, name, NULL FROM categories")
+            for table in unowned:
+                if 'user_id' not in table_columns(table):
+                    db.execute(f"ALTER TABLE {table} ADD COLUMN user_id INTEGER REFERENCES users (id)")
+                db.execute(f"UPDATE {table} SET user_id = (SELECT MIN(id) FROM users) WHERE user_id IS NULL")
+    finally:
+        db.execute("PRAGMA foreign_keys = ON")
+
+# Rollups kept current by the same triggers: monthly_summary by month,
+# category and type, and daily_summary by day and type for the daily and
+# weekly charts (rows without a date are left out of the daily one)
+MONTHLY_SUMMARY_VERSION = '5'
+
+SUMMARY_KEY = "COALESCE({row}.user_id, 0), COALESCE(strftime('%Y-%m', {row}.date + 2440587.5), ''), COALESCE({row}.category_id, 0), COALESCE({row}.type, '')"
+
+SUMMARY_ADD = '''INSERT INTO monthly_summary (user_id, month, category_id, type, amount, count)
+                 VALUES ({key}, COALESCE({row}.amount, 0), 1)
+                 ON CONFLICT (user_id, month, category_id, type)
+                 DO UPDATE SET amount = amount + excluded.amount, count = count + 1;'''
+
+SUMMARY_REMOVE = '''UPDATE monthly_summary SET amount = amount - COALESCE({row}.amount, 0), count = count - 1
+                    WHERE (user_id, month, category_id, type) = ({key});
+                    DELETE FROM monthly_summary WHERE count <= 0 AND (user_id, month, category_id, type) = ({key});'''
+
+DAILY_KEY = "COALESCE({row}.user_id, 0), {row}.date, COALESCE({row}.type, '')"
+
+DAILY_ADD = '''INSERT INTO daily_summary (user_id, day, type, amount, count)
+               SELECT {key}, COALESCE({row}.amount, 0), 1 WHERE {row}.date IS NOT NULL
+               ON CONFLICT (user_id, day, type)
+               DO UPDATE SET amount = amount + excluded.amount, count = count + 1;'''
+
+DAILY_REMOVE = '''UPDATE daily_summary SET amount = amount - COALESCE({row}.amount, 0), count = count - 1
+                  WHERE (user_id, day, type) = ({key});
+                  DELETE FROM daily_summary WHERE count <= 0 AND (user_id, day, type) = ({key});'''
+
+def _summary_sql(template, row, key=SUMMARY_KEY):
+    return template.format(key=key.format(row=row), row=row)
+
+def _rollups_sql(row, add):
+    if add:
+        return _summary_sql(SUMMARY_ADD, row) + ' ' + _summary_sql(DAILY_ADD, row, DAILY_KEY)
+    return _summary_sql(SUMMARY_REMOVE, row) + ' ' + _summary_sql(DAILY_REMOVE, row, DAILY_KEY)
+
+def drop_monthly_summary(cursor):
+    for trigger in ('monthly_summary_insert', 'monthly_summary_delete', 'monthly_summary_update'):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cursor.execute("DROP TABLE IF EXISTS monthly_summary")
+    cursor.execute("DROP TABLE IF EXISTS daily_summary")
+
+def create_monthly_summary(cursor):
+    cursor.execute('''CREATE TABLE IF NOT EXISTS monthly_summary
+                      (user_id INTEGER NOT NULL,
+                       month TEXT NOT NULL,
+                       category_id INTEGER NOT NULL,
+                       type TEXT NOT NULL,
+                       amount INTEGER NOT NULL DEFAULT 0,
+                       count INTEGER NOT NULL DEFAULT 0,
+                       PRIMARY KEY (user_id, month, category_id, type)) WITHOUT ROWID''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS daily_summary
+                      (user_id INTEGER NOT NULL,
+                       day INTEGER NOT NULL,
+                       type TEXT NOT NULL,
+                       amount INTEGER NOT NULL DEFAULT 0,
+                       count INTEGER NOT NULL DEFAULT 0,
+                       PRIMARY KEY (user_id, day, type)) WITHOUT ROWID''')
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS monthly_summary_insert AFTER INSERT ON transactions
+                       BEGIN {_rollups_sql('NEW', add=True)} END''')
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS monthly_summary_delete AFTER DELETE ON transactions
+                       BEGIN {_rollups_sql('OLD', add=False)} END''')
+    # An edited row leaves its old buckets and joins its new ones
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS monthly_summary_update
+                       AFTER UPDATE OF date, category_id, amount, type, user_id ON transactions
+                       BEGIN {_rollups_sql('OLD', add=False)} {_rollups_sql('NEW', add=True)} END''')
+
+MONTHLY_SUMMARY_SOURCE = '''SELECT COALESCE(user_id, 0) AS user_id, COALESCE(strftime('%Y-%m', date + 2440587.5), '') AS month,
+                                   COALESCE(category_id, 0) AS category_id, COALESCE(type, '') AS type,
+                                   SUM(COALESCE(amount, 0)) AS amount, COUNT(*) AS count
+                            FROM transactions GROUP BY 1, 2, 3, 4'''
+DAILY_SUMMARY_SOURCE = '''SELECT COALESCE(user_id, 0) AS user_id, date AS day, COALESCE(type, '') AS type,
+                                 SUM(COALESCE(amount, 0)) AS amount, COUNT(*) AS count
+                          FROM transactions WHERE date IS NOT NULL GROUP BY 1, 2, 3'''
+
+# (table, columns, rows from the ledger) of each rollup
+ROLLUPS = (
+    ('monthly_summary', 'user_id, month, category_id, type, amount, count', MONTHLY_SUMMARY_SOURCE),
+    ('daily_summary', 'user_id, day, type, amount, count', DAILY_SUMMARY_SOURCE),
+)
+
+# One-shot rebuild of the rollups from the ledger, used for existing databases
+def rebuild_monthly_summary():
+    db = connection()
+    with transaction(db):
+        for table, columns, source in ROLLUPS:
+            db.execute(f"DELETE FROM {table}")
+            db.execute(f"INSERT INTO {table} ({columns}) {source}")
+        set_meta('monthly_summary_version', MONTHLY_SUMMARY_VERSION, db=db)
+    return verify_monthly_summary()
+
+# Number of rollup buckets that disagree with the ledger (0 when in sync)
+def verify_monthly_summary():
+    db = connection()
+    mismatches = 0
+    for table, columns, source in ROLLUPS:
+        rollup = f"SELECT {columns} FROM {table}"
+        ledger = f"SELECT {columns} FROM ({source})"
+        mismatches += db.execute(f"""SELECT COUNT(*) FROM (SELECT * FROM ({rollup} EXCEPT {ledger})
+                                                           UNION ALL
+                                                           SELECT * FROM ({ledger} EXCEPT {rollup}))""").fetchone()[0]
+    return mismatches
+
+# Full-text index over description and category name, kept in sync by
+# triggers on transactions and on category renames. Returns False when this
+# SQLite build has no FTS5, in which case search falls back to LIKE.
+TRANSACTIONS_FTS_VERSION = '2'
+
+def drop_transaction_search(cursor):
+    for trigger in ('transactions_fts_insert', 'transactions_fts_delete', 'transactions_fts_update',
+                    'categories_fts_rename'):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cursor.execute("DROP TABLE IF EXISTS transactions_fts")
+
+def create_transaction_search(cursor):
+    try:
+        cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5(description, category)")
+    except sqlite3.OperationalError:
+        return False
+    fts_insert = ("INSERT INTO transactions_fts (rowid, description, category) "
+                  "VALUES (NEW.id, NEW.description, (SELECT name FROM categories WHERE id = NEW.category_id));")
+    fts_delete = "DELETE FROM transactions_fts WHERE rowid = OLD.id;"
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS transactions_fts_insert AFTER INSERT ON transactions BEGIN {fts_insert} END")
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS transactions_fts_delete AFTER DELETE ON transactions BEGIN {fts_delete} END")
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS transactions_fts_update
+                       AFTER UPDATE OF description, category_id ON transactions
+                       BEGIN {fts_delete} {fts_insert} END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS categories_fts_rename AFTER UPDATE OF name ON categories
+                      BEGIN
+                          UPDATE transactions_fts SET category = NEW.name
+                          WHERE rowid IN (SELECT id FROM transactions WHERE category_id = NEW.id);
+                      END''')
+    return True
+
+# Bulk inserts skip the per-row insert triggers of the rollups and the search
+# index: the triggers are dropped while the rows go in and recreated after.
+# The context yields insert(rows), which takes a dict of equal-length arrays
+# keyed by BULK_INSERT_COLUMNS (no missing values), inserts them and adds
+# them to the rollups with one grouped upsert per rollup, summed in pandas.
+# Runs inside the caller's transaction, so other connections never see the
+# triggers missing. The new rows' id range is queued in search_backlog rather
+# than indexed here; see index_search_backlog().
+BULK_INSERT_COLUMNS = ('date', 'category_id', 'amount', 'description', 'type', 'content_hash', 'user_id')
+
+@contextmanager
+def bulk_insert(db, search_available):
+    after_id = db.execute("SELECT COALESCE(MAX(id), 0) FROM transactions").fetchone()[0]
+    db.execute("DROP TRIGGER IF EXISTS monthly_summary_insert")
+    db.execute("DROP TRIGGER IF EXISTS transactions_fts_insert")
+
+    def insert(rows):
+        db.executemany(f'''INSERT INTO transactions ({', '.join(BULK_INSERT_COLUMNS)})
+                           VALUES ({', '.join('?' * len(BULK_INSERT_COLUMNS))})''',
+                       zip(*(rows[column].tolist() for column in BULK_INSERT_COLUMNS)))
+        frame = pd.DataFrame({'user_id': rows['user_id'], 'day': rows['date'], 'category_id': rows['category_id'],
+                              'type': rows['type'], 'amount': rows['amount']})
+        frame['month'] = frame['day'].to_numpy().astype('datetime64[D]').astype('datetime64[M]')
+        for table, keys in (('monthly_summary', ['user_id', 'month', 'category_id', 'type']),
+                            ('daily_summary', ['user_id', 'day', 'type'])):
+            groups = frame.groupby(keys, sort=False)['amount'].agg(['sum', 'size']).reset_index()
+            if 'month' in groups:
+                groups['month'] = np.datetime_as_string(groups['month'].to_numpy().astype('datetime64[M]'))
+            db.executemany(f'''INSERT INTO {table} ({', '.join(keys)}, amount, count)
+                               VALUES ({', '.join('?' * (len(keys) + 2))})
+                               ON CONFLICT ({', '.join(keys)})
+                               DO UPDATE SET amount = amount + excluded.amount, count = count + excluded.count''',
+                           zip(*(groups[column].tolist() for column in keys + ['sum', 'size'])))
+
+    yield insert
+    create_monthly_summary(db)
+    if search_available:
+        last_id = db.execute("SELECT MAX(id) FROM transactions").fetchone()[0]
+        if last_id is not None and last_id > after_id:
+            db.execute("INSERT INTO search_backlog (first_id, last_id) VALUES (?, ?)", (after_id + 1, last_id))
+        create_transaction_search(db)
+
+# Indexes the rows bulk inserts left out of the search index. Runs on the
+# background worker after writes and before every full-text search, so a
+# search never misses them; rows edited in the meantime were indexed by the
+# update trigger and are skipped. Returns the number of rows indexed.
+def index_search_backlog(db=None):
+    db = db or connection()
+    if db.execute("SELECT 1 FROM search_backlog LIMIT 1").fetchone() is None:
+        return 0
+    indexed = 0
+    with transaction(db):
+        for first_id, last_id in db.execute("SELECT first_id, last_id FROM search_backlog").fetchall():
+            indexed += db.execute('''INSERT INTO transactions_fts (rowid, description, category)
+                                       SELECT id, description, category FROM transactions_view
+                                       WHERE id BETWEEN ? AND ?
+                                         AND id NOT IN (SELECT rowid FROM transactions_fts WHERE rowid BETWEEN ? AND ?)''',
+                                  (first_id, last_id, first_id, last_id)).rowcount
+        db.execute("DELETE FROM search_backlog")
+    return indexed
+
+# Schedules remember the date they were started from (anchor_date), so monthly
+# occurrences keep their day of month after a short month. Editing the next
+# date by hand re-anchors the schedule; the engine's own updates also move
+# last_posted, which tells the two apart. Any new or moved date pulls the
+# 'scheduled_next_due' watermark back so the engine does not skip it.
+def create_schedule_triggers(cursor):
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS scheduled_anchor_insert AFTER INSERT ON scheduled_transactions
+                      BEGIN
+                          UPDATE scheduled_transactions SET anchor_date = COALESCE(NEW.anchor_date, NEW.date) WHERE id = NEW.id;
+                          UPDATE app_meta SET value = MIN(CAST(value AS INTEGER), NEW.date) WHERE key = 'scheduled_next_due';
+                      END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS scheduled_anchor_update AFTER UPDATE OF date ON scheduled_transactions
+                      BEGIN
+                          UPDATE scheduled_transactions SET anchor_date = NEW.date
+                          WHERE id = NEW.id AND NEW.last_posted IS OLD.last_posted AND NEW.date IS NOT OLD.date;
+                          UPDATE app_meta SET value = MIN(CAST(value AS INTEGER), NEW.date) WHERE key = 'scheduled_next_due';
+                      END''')
+
+# Database migration and initialization
+@profiled
+def migrate_database():
+    db = connection()
+    cursor = db.cursor()
+    # Tables of the original layout, which the steps below upgrade
+    cursor.execute('''CREATE TABLE IF NOT EXISTS transactions
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     date TEXT, category TEXT, amount REAL, description TEXT, type TEXT)''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS categories
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     name TEXT UNIQUE)''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS users
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     username TEXT UNIQUE, password TEXT)''')
+    cursor.execute("DROP TABLE IF EXISTS income")
+    cursor.execute("PRAGMA table_info(transactions)")
+    columns = [column[1] for column in cursor.fetchall()]
+    if 'type' not in columns:
+        cursor.execute("ALTER TABLE transactions ADD COLUMN type TEXT")
+    cursor.execute(GOALS_TABLE.format(name='IF NOT EXISTS goals'))
+    cursor.execute(SCHEDULED_TRANSACTIONS_TABLE.format(name='IF NOT EXISTS scheduled_transactions'))
+    cursor.execute('''CREATE TABLE IF NOT EXISTS app_meta
+                      (key TEXT PRIMARY KEY,
+                       value TEXT)''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS job_locks
+                      (name TEXT PRIMARY KEY,
+                       owner TEXT,
+                       expires_at REAL)''')
+    # Id ranges of bulk-inserted rows still missing from the search index
+    cursor.execute('''CREATE TABLE IF NOT EXISTS search_backlog
+                      (first_id INTEGER NOT NULL,
+                       last_id INTEGER NOT NULL)''')
+    # Postings made by the scheduled-transaction engine carry their schedule and
+    # occurrence, which makes re-posting the same occurrence a no-op
+    cursor.execute("PRAGMA table_info(transactions)")
+    columns = [column[1] for column in cursor.fetchall()]
+    if 'schedule_id' not in columns:
+        cursor.execute("ALTER TABLE transactions ADD COLUMN schedule_id INTEGER")
+        cursor.execute("ALTER TABLE transactions ADD COLUMN occurrence_date TEXT")
+    # Imported rows carry a hash of their content so re-imports can skip them
+    if 'content_hash' not in columns:
+        cursor.execute("ALTER TABLE transactions ADD COLUMN content_hash INTEGER")
+    cursor.execute("PRAGMA table_info(scheduled_transactions)")
+    columns = [column[1] for column in cursor.fetchall()]
+    if 'anchor_date' not in columns:
+        cursor.execute("ALTER TABLE scheduled_transactions ADD COLUMN anchor_date TEXT")
+        cursor.execute("ALTER TABLE scheduled_transactions ADD COLUMN last_posted TEXT")
+        cursor.execute("UPDATE scheduled_transactions SET anchor_date = date")
+    upgrade_tables()
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_scheduled_transactions_date ON scheduled_transactions (date)")
+    cursor.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_schedule_occurrence
+                      ON transactions (schedule_id, occurrence_date) WHERE schedule_id IS NOT NULL''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_category_id ON transactions (category_id)")
+    # Every per-user query leads with user_id, so its cost depends on that
+    # user's rows only; the date index also serves keyset pagination. Imports
+    # read a user's content hashes once per file, which the user index covers
+    # well enough; a content hash index only slowed down every insert.
+    for index in ('idx_transactions_content_hash', 'idx_transactions_user_content_hash', 'idx_transactions_date',
+                  'idx_transactions_amount'):
+        cursor.execute(f"DROP INDEX IF EXISTS {index}")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_user_date ON transactions (user_id, date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_user_amount ON transactions (user_id, amount)")
+    # Carries the rowid, so the most recently added rows are a backward walk
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_user ON transactions (user_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_goals_user ON goals (user_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_scheduled_transactions_user ON scheduled_transactions (user_id)")
+    # The dashboard aggregations read monthly_summary, so the type-leading
+    # covering indexes only slowed down inserts
+    cursor.execute("DROP INDEX IF EXISTS idx_transactions_type_date")
+    cursor.execute("DROP INDEX IF EXISTS idx_transactions_type_category")
+    cursor.execute(f"CREATE VIEW IF NOT EXISTS transactions_view AS {TRANSACTIONS_VIEW}")
+    # Schedules still store the category name; keep them pointing at renamed categories
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS categories_rename AFTER UPDATE OF name ON categories
+                      BEGIN
+                          UPDATE scheduled_transactions SET category = NEW.name
+                          WHERE user_id IS NEW.user_id AND category = OLD.name;
+                      END''')
+    summary_stale = get_meta('monthly_summary_version', db=db) != MONTHLY_SUMMARY_VERSION
+    if summary_stale:
+        drop_monthly_summary(cursor)
+    create_monthly_summary(cursor)
+    create_schedule_triggers(cursor)
+    search_stale = get_meta('transactions_fts_version', db=db) != TRANSACTIONS_FTS_VERSION
+    if search_stale:
+        drop_transaction_search(cursor)
+    search_available = create_transaction_search(cursor)
+    if summary_stale:
+        mismatches = rebuild_monthly_summary()
+        if mismatches:
+            warnings.warn(f'{mismatches} rollup bucket(s) disagree with the ledger after the rebuild; '
+                          'run python -m finance_tracker verify --rebuild')
+    if search_available and search_stale:
+        with transaction(db):
+            db.execute('''INSERT INTO transactions_fts (rowid, description, category)
+                            SELECT id, description, category FROM transactions_view''')
+            db.execute("DELETE FROM search_backlog")
+            set_meta('transactions_fts_version', TRANSACTIONS_FTS_VERSION, db=db)
+    return search_available
+
+# Migrations run once per process, on first use; later calls only return
+# whether full-text search is available
+_migration_lock = threading.Lock()
+_search_available = None
+
+def ensure_schema():
+    global _search_available
+    with _migration_lock:
+        if _search_available is None:
+            _search_available = migrate_database()
+    return _search_available
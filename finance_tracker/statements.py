@@ -0,0 +1,124 @@
+import csv
+import hashlib
+import io
+import re
+
+import numpy as np
+import pandas as pd
+
+from .db import connection, query_cache, transaction
+from .profiling import profiled
+from .schema import bulk_insert, ensure_schema
+
+# Bulk import of bank statements. Files are read as a stream of fixed-size
+# chunks, each a dict of numpy arrays keyed by IMPORT_COLUMNS. Rows whose
+# content hash the user already had before the import started are skipped,
+# missing categories are created, and the rest go straight into the ledger;
+# the rollups catch up once per chunk and the search index after the import
+# (see bulk_insert()).
+IMPORT_CHUNK_SIZE = 50000
+IMPORT_FIELDS = ('date', 'category', 'amount', 'description', 'type')
+IMPORT_COLUMNS = ('date', 'category', 'amount', 'description', 'type', 'content_hash')
+
+# Builds a chunk from the dates (anything numpy reads as datetime64) and the
+# raw text of the other fields. The content hash covers date, amount,
+# description and type, so a statement line hashes the same in either format.
+def import_chunk(posted, categories, amounts, descriptions, types):
+    try:
+        amounts = np.array(amounts, dtype=object).astype(float)
+    except ValueError:
+        amounts = np.array([float(amount.strip().lstrip('$').replace(',', '')) for amount in amounts])
+    # Without a type the sign decides: money out is an expense
+    types = np.array(types, dtype=object)
+    untyped = types == ''
+    types[untyped] = np.where(amounts[untyped] < 0, 'Expense', 'Income')
+    amounts = np.abs(amounts)
+    days = np.asarray(posted, dtype='datetime64[D]')
+    if np.isnat(days).any():
+        raise ValueError('every row needs a date')
+    blake2b = hashlib.blake2b
+    content_hashes = [int.from_bytes(blake2b(f'{day}|{amount:.2f}|{description}|{kind}'.encode(), digest_size=8).digest(),
+                                     'big', signed=True)
+                      for day, amount, description, kind in zip(days.astype(str).tolist(), amounts.tolist(),
+                                                                descriptions, types.tolist())]
+    return {'date': days.astype(np.int64), 'category': np.array(categories, dtype=object),
+            'amount': np.rint(amounts * 100).astype(np.int64), 'description': np.array(descriptions, dtype=object),
+            'type': types, 'content_hash': np.array(content_hashes, dtype=np.int64)}
+
+def read_csv_header(fileobj):
+    text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    header = next(csv.reader(text), [])
+    text.detach()
+    fileobj.seek(0)
+    return header
+
+def iter_csv_chunks(fileobj, mapping, date_format='%Y-%m-%d', default_category='Uncategorized',
+                    chunk_size=IMPORT_CHUNK_SIZE):
+    columns = {field: column for field, column in mapping.items() if column}
+    reader = pd.read_csv(fileobj, encoding='utf-8-sig', dtype=object, keep_default_na=False,
+                         usecols=list(set(columns.values())), chunksize=chunk_size)
+    for rows in reader:
+        field = lambda name, default: rows[columns[name]].tolist() if name in columns else [default] * len(rows)
+        dates = [value.strip() for value in rows[columns['date']].tolist()]
+        if date_format == '%Y-%m-%d':
+            posted = np.array([value[:10] for value in dates], dtype='datetime64[D]')
+        else:
+            posted = pd.to_datetime(pd.Series(dates, dtype=object), format=date_format).to_numpy()
+        yield import_chunk(posted, field('category', default_category), field('amount', ''),
+                           field('description', ''), field('type', ''))
+
+OFX_FIELD = re.compile(r'<(\w+)>([^<\r\n]*)')
+
+def iter_ofx_chunks(fileobj, default_category='Uncategorized', chunk_size=IMPORT_CHUNK_SIZE):
+    text = io.TextIOWrapper(fileobj, encoding='utf-8', errors='replace')
+    buffer, posted, amounts, descriptions = '', [], [], []
+    while True:
+        block = text.read(1 << 20)
+        buffer += block
+        *statements, buffer = buffer.split('</STMTTRN>')
+        for statement in statements:
+            fields = {tag.upper(): value.strip() for tag, value in OFX_FIELD.findall(statement[statement.rfind('<STMTTRN>'):])}
+            date = fields['DTPOSTED']
+            posted.append(f'{date[:4]}-{date[4:6]}-{date[6:8]}')
+            amounts.append(fields['TRNAMT'])
+            descriptions.append(fields.get('NAME') or fields.get('MEMO', ''))
+            if len(posted) >= chunk_size:
+                yield import_chunk(posted, [default_category] * len(posted), amounts, descriptions, [''] * len(posted))
+                posted, amounts, descriptions = [], [], []
+        if not block:
+            break
+    if posted:
+        yield import_chunk(posted, [default_category] * len(posted), amounts, descriptions, [''] * len(posted))
+
+# Duplicates are looked up among the content hashes the user had before the
+# import, read once up front, so a file may still repeat a line of its own
+@profiled
+def import_transactions(chunks, user_id, progress=None):
+    db = connection()
+    search_available = ensure_schema()
+    existing = np.sort(np.array(db.execute("SELECT content_hash FROM transactions "
+                                           "WHERE user_id = ? AND content_hash IS NOT NULL", (user_id,)).fetchall(),
+                                dtype=np.int64).reshape(-1))
+    categories = dict(db.execute("SELECT name, id FROM categories WHERE user_id = ?", (user_id,)))
+    inserted = total = 0
+    try:
+        for chunk in chunks:
+            total += len(chunk['date'])
+            positions = np.searchsorted(existing, chunk['content_hash']).clip(max=max(len(existing) - 1, 0))
+            new = existing[positions] != chunk['content_hash'] if len(existing) else slice(None)
+            chunk = {column: values[new] for column, values in chunk.items()}
+            with transaction(db), bulk_insert(db, search_available) as insert:
+                missing = [name for name in set(chunk['category'].tolist()) if name not in categories]
+                if missing:
+                    db.executemany("INSERT OR IGNORE INTO categories (user_id, name) VALUES (?, ?)",
+                                   [(user_id, name) for name in missing])
+                    categories.update(db.execute("SELECT name, id FROM categories WHERE user_id = ?", (user_id,)))
+                chunk['category_id'] = np.array([categories[name] for name in chunk['category'].tolist()], dtype=np.int64)
+                chunk['user_id'] = np.full(len(chunk['date']), user_id, dtype=np.int64)
+                insert(chunk)
+            inserted += len(chunk['date'])
+            if progress:
+                progress(total)
+    finally:
+        query_cache.invalidate()
+    return inserted, total - inserted
@@ -0,0 +1,99 @@
+import os
+from datetime import datetime
+
+import numpy as np
+
+from .db import EPOCH_ORDINAL, transaction, use_database
+from .schema import drop_monthly_summary, drop_transaction_search, migrate_database
+from .users import hash_password
+
+# Synthetic ledgers for benchmarks: the same seed always gives the same data.
+# Transactions are generated and inserted in chunks, so memory stays flat at
+# any size. The rollup and search triggers are dropped for the load and
+# migrate_database() rebuilds both afterwards, which is much faster than
+# maintaining them row by row.
+SIZES = {'10k': 10_000, '100k': 100_000, '1M': 1_000_000, '10M': 10_000_000}
+GENERATE_CHUNK_SIZE = 100_000
+SYNTHETIC_PASSWORD = 'password'
+
+INCOME_CATEGORIES = ('Salary', 'Freelance')
+EXPENSE_CATEGORIES = ('Groceries', 'Rent', 'Dining', 'Transport', 'Utilities', 'Shopping', 'Entertainment', 'Health',
+                      'Travel', 'Subscriptions', 'Insurance', 'Fuel', 'Gifts', 'Education', 'Pets', 'Taxes')
+MERCHANTS = ('coffee', 'market', 'station', 'online', 'pharmacy', 'cinema', 'airline', 'hotel', 'bakery', 'bookstore',
+             'hardware', 'restaurant', 'payroll', 'client', 'utility', 'insurer')
+FREQUENCIES = ('One-time', 'Weekly', 'Monthly', 'Yearly')
+
+# '10k', '1M', '2500' -> number of rows
+def parse_size(text):
+    text = text.strip()
+    multiplier = {'k': 1_000, 'K': 1_000, 'm': 1_000_000, 'M': 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip('kKmM')) * multiplier)
+
+# Expense categories get Zipf-like weights, so a few dominate like in real ledgers
+def expense_weights():
+    weights = 1 / np.arange(1, len(EXPENSE_CATEGORIES) + 1)
+    return weights / weights.sum()
+
+def generate_ledger(path, rows, users=1, schedules=200, goals=20, years=5, seed=0, progress=None):
+    if os.path.exists(path):
+        raise FileExistsError(f'{path} already exists')
+    rng = np.random.default_rng(seed)
+    today = datetime.now().toordinal() - EPOCH_ORDINAL
+    db = use_database(path)
+    migrate_database()
+    names = INCOME_CATEGORIES + EXPENSE_CATEGORIES
+    with transaction(db):
+        db.executemany("INSERT INTO users (username, password) VALUES (?, ?)",
+                       [(f'user{user}', hash_password(SYNTHETIC_PASSWORD)) for user in range(1, users + 1)])
+        user_ids = [row[0] for row in db.execute("SELECT id FROM users ORDER BY id")]
+        db.executemany("INSERT INTO categories (name, user_id) VALUES (?, ?)",
+                       [(name, user_id) for user_id in user_ids for name in names])
+        category_ids = np.array([row[0] for row in db.execute("SELECT id FROM categories ORDER BY user_id, id")],
+                                dtype=np.int64).reshape(users, len(names))
+        drop_monthly_summary(db)
+        drop_transaction_search(db)
+        db.execute("DELETE FROM app_meta WHERE key IN ('monthly_summary_version', 'transactions_fts_version')")
+
+    written = 0
+    while written < rows:
+        size = min(GENERATE_CHUNK_SIZE, rows - written)
+        owners = rng.integers(0, users, size)
+        income = rng.random(size) < 0.15
+        category = np.where(income, rng.integers(0, len(INCOME_CATEGORIES), size),
+                            len(INCOME_CATEGORIES) + rng.choice(len(EXPENSE_CATEGORIES), size, p=expense_weights()))
+        cents = np.where(income, rng.lognormal(11.5, 0.6, size), rng.lognormal(8, 1.1, size)).astype(np.int64) + 1
+        days = today - rng.integers(0, years * 365, size)
+        merchants = rng.integers(0, len(MERCHANTS), size)
+        numbers = rng.integers(1, 10_000, size)
+        records = zip(days.tolist(), category_ids[owners, category].tolist(), cents.tolist(),
+                      [f'{MERCHANTS[merchant]} {number}' for merchant, number in zip(merchants.tolist(), numbers.tolist())],
+                      np.where(income, 'Income', 'Expense').tolist(), np.asarray(user_ids)[owners].tolist())
+        with transaction(db):
+            db.executemany("INSERT INTO transactions (date, category_id, amount, description, type, user_id) "
+                           "VALUES (?, ?, ?, ?, ?, ?)", records)
+        written += size
+        if progress:
+            progress(written)
+
+    with transaction(db):
+        for user_id in user_ids:
+            db.executemany("INSERT INTO goals (name, target_amount, current_amount, deadline, user_id) "
+                           "VALUES (?, ?, 0, ?, ?)",
+                           [(f'Goal {goal + 1}', target, deadline, user_id) for goal, target, deadline in zip(
+                               range(goals), (rng.lognormal(13, 1, goals).astype(np.int64) + 100).tolist(),
+                               (today + rng.integers(30, 5 * 365, goals)).tolist())])
+            # Next dates from a year back to a month ahead, so the catch-up engine has work to do
+            income = rng.random(schedules) < 0.3
+            db.executemany("INSERT INTO scheduled_transactions (date, category, amount, description, type, "
+                           "frequency, user_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                           list(zip((today + rng.integers(-365, 30, schedules)).tolist(),
+                                    [INCOME_CATEGORIES[0] if flag else EXPENSE_CATEGORIES[index] for flag, index in
+                                     zip(income, rng.integers(0, len(EXPENSE_CATEGORIES), schedules))],
+                                    (rng.lognormal(9, 1, schedules).astype(np.int64) + 1).tolist(),
+                                    [f'schedule {number + 1}' for number in range(schedules)],
+                                    np.where(income, 'Income', 'Expense').tolist(),
+                                    rng.choice(FREQUENCIES, schedules, p=[0.1, 0.2, 0.6, 0.1]).tolist(),
+                                    [user_id] * schedules)))
+    # Recreates the rollup and search index from the loaded ledger
+    migrate_database()
+    return db
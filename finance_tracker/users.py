@@ -0,0 +1,35 @@
+import hashlib
+
+from .db import connection, query_cache, transaction
+from .profiling import profiled
+from .schema import PARTITIONED_TABLES
+
+# Hash password function
+def hash_password(password):
+    return hashlib.sha256(password.encode()).hexdigest()
+
+# CRUD functions for users
+# Each user's rows form a partition keyed by user_id. The first user to
+# register takes over the rows that predate users.
+@profiled
+def add_user(username, password):
+    hashed_password = hash_password(password)
+    with transaction() as db:
+        user_id = db.execute("INSERT INTO users (username, password) VALUES (?, ?)",
+                             (username, hashed_password)).lastrowid
+        if db.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 1:
+            for table in PARTITIONED_TABLES:
+                db.execute(f"UPDATE {table} SET user_id = ? WHERE user_id IS NULL", (user_id,))
+    query_cache.invalidate()
+    return user_id
+
+# The user's id (their partition) when the credentials match, else None
+@profiled
+def validate_user(username, password):
+    hashed_password = hash_password(password)
+    user = connection().execute("SELECT id FROM users WHERE username = ? AND password = ?", (username, hashed_password)).fetchone()
+    return user[0] if user else None
+
+def get_user_id(username):
+    user = connection().execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()
+    return user[0] if user else None
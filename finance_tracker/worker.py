@@ -0,0 +1,81 @@
+import json
+import os
+import queue
+import socket
+import threading
+import time
+
+from .db import get_meta, set_meta
+from .goals import update_goals_with_balance
+from .schedules import process_scheduled_transactions
+from .schema import index_search_backlog
+
+# Background worker: a daemon thread with its own connection that runs jobs
+# from a queue, on a timer and after writes. A lease in job_locks keeps two
+# processes sharing the database from running the same job at once. Each
+# run's status and duration are stored in app_meta under 'job:<name>'.
+JOBS = {
+    'process_scheduled_transactions': process_scheduled_transactions,
+    'update_goals_with_balance': update_goals_with_balance,
+    'index_search_backlog': index_search_backlog,
+}
+
+class BackgroundWorker:
+    def __init__(self, connections, jobs, interval=60, lease=300):
+        self.connections = connections
+        self.jobs = jobs
+        self.interval = interval
+        self.lease = lease
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{id(self)}'
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name='finance-tracker-worker', daemon=True)
+
+    def start(self):
+        self.enqueue_all()
+        self.thread.start()
+
+    def enqueue(self, name):
+        self.queue.put(name)
+
+    def enqueue_all(self):
+        for name in self.jobs:
+            self.enqueue(name)
+
+    def _run(self):
+        db = self.connections.get()
+        while True:
+            try:
+                names = {self.queue.get(timeout=self.interval)}
+            except queue.Empty:
+                names = set(self.jobs)
+            # Writes tend to arrive in bursts; run each queued job once
+            while not self.queue.empty():
+                names.add(self.queue.get_nowait())
+            for name in self.jobs:
+                if name in names:
+                    self.run_job(db, name)
+
+    def run_job(self, db, name):
+        if not self._acquire(db, name):
+            return
+        started = time.time()
+        try:
+            result = self.jobs[name](db)
+            status = 'ok'
+        except Exception as e:
+            result, status = None, f'error: {e}'
+        finally:
+            db.execute("DELETE FROM job_locks WHERE name = ? AND owner = ?", (name, self.owner))
+        set_meta(f'job:{name}', json.dumps({'status': status, 'last_run': started,
+                                            'duration': time.time() - started, 'result': result}), db=db)
+
+    def _acquire(self, db, name):
+        now = time.time()
+        acquired = db.execute("INSERT INTO job_locks (name, owner, expires_at) VALUES (?, ?, ?) "
+                              "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                              "WHERE job_locks.expires_at < ?", (name, self.owner, now + self.lease, now)).rowcount
+        return acquired == 1
+
+def get_job_status(name):
+    status = get_meta(f'job:{name}')
+    return json.loads(status) if status else None